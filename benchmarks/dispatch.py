@@ -0,0 +1,85 @@
+"""
+    Compares the single-pass TagDispatcher with a find_all per selector on saved WHO pages
+    Usage:
+        python -m benchmarks.dispatch page1.html page2.html [--repeat 20]
+        python -m benchmarks.dispatch --compare-output https://www.who.int/...  (builds zips both ways)
+"""
+import argparse
+import os
+import tempfile
+import time
+import zipfile
+
+from bs4 import BeautifulSoup
+from webmixer.scrapers.tags import COMMON_TAGS
+
+from scrapers.dispatch import TagDispatcher
+from scrapers.who import WHOPageScraper
+
+
+def legacy_collect(contents, omit_list, tag_classes):
+    """ Finds elements the way HTMLPageScraper does (one find_all per selector) """
+    for item in omit_list:
+        for element in contents.find_all(*item):
+            element.decompose()
+    return [contents.find_all(*tag_class.selector) for tag_class in tag_classes]
+
+
+def time_best(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_page(path, repeat):
+    """ Times finding elements both ways and checks they find the same elements in the same order """
+    with open(path, 'rb') as fobj:
+        html = fobj.read()
+
+    tag_classes = WHOPageScraper.extra_tags + COMMON_TAGS
+    dispatcher = TagDispatcher(tag_classes, omit_list=WHOPageScraper.omit_list)
+
+    legacy = legacy_collect(BeautifulSoup(html, 'html.parser'), WHOPageScraper.omit_list, tag_classes)
+    _, buckets = dispatcher.collect(BeautifulSoup(html, 'html.parser'))
+    position = lambda elements: [(element.sourceline, element.sourcepos) for element in elements]
+    identical = all(position(a) == position(b) for a, b in zip(legacy, buckets))
+
+    # Parse outside of the timed section so only finding elements is measured
+    trees = [BeautifulSoup(html, 'html.parser') for _ in range(repeat * 2)]
+    legacy_time = time_best(lambda: legacy_collect(trees.pop(), WHOPageScraper.omit_list, tag_classes), repeat)
+    dispatch_time = time_best(lambda: dispatcher.collect(trees.pop()), repeat)
+
+    print('{:<50} {:>7}KB  find_all: {:7.1f}ms  single pass: {:7.1f}ms  {:4.1f}x  {}'.format(
+        os.path.basename(path)[:50], len(html) // 1024, legacy_time * 1000, dispatch_time * 1000,
+        legacy_time / dispatch_time, 'same elements' if identical else 'DIFFERENT ELEMENTS'))
+    return identical
+
+
+def compare_output(url):
+    """ Builds url with and without the dispatcher and checks the zips have the same index.html """
+    outputs = []
+    for single_pass in (False, True):
+        scraper = WHOPageScraper(url)
+        scraper.single_pass = single_pass
+        path = scraper.to_file(directory=tempfile.mkdtemp(), overwrite=True)
+        with zipfile.ZipFile(path) as zf:
+            outputs.append(zf.read('index.html'))
+    identical = outputs[0] == outputs[1]
+    print('{}  {}'.format(url, 'identical' if identical else 'DIFFERENT OUTPUT'))
+    return identical
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the single-pass tag dispatcher.')
+    parser.add_argument('pages', nargs='*', help='Saved WHO pages to benchmark.')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of times to time each page.')
+    parser.add_argument('--compare-output', nargs='+', default=[], metavar='URL', help='Build urls both ways and compare.')
+    args = parser.parse_args()
+
+    results = [benchmark_page(path, args.repeat) for path in args.pages]
+    results += [compare_output(url) for url in args.compare_output]
+    raise SystemExit(int(not all(results)))
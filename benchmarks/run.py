@@ -0,0 +1,144 @@
+"""
+    Benchmarks a single-language build, each topic page and each tag class against
+    responses recorded with `./sushichef.py --record ARCHIVE`, so runs can be compared
+    without the live site
+    Video topics are skipped, as the archive only keeps the headers of videos
+    Usage:
+        python -m benchmarks.run ARCHIVE [--language en] [--compare benchmarks/results/<previous>.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from collections import defaultdict
+from contextlib import contextmanager
+from le_utils.constants import content_kinds
+from ricecooker.classes import nodes
+
+import sushichef
+from scrapers import who
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def measure(function):
+    """
+        Runs function once while tracing its memory use (times include tracemalloc's overhead,
+        which is the same for every run being compared)
+        Returns (result, seconds, peak memory in MB)
+    """
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak / 1024 ** 2
+
+
+class BenchmarkChef(sushichef.WhoCovidAdviceChef):
+    """ Chef that leaves video topics empty, as replaying header-only videos doesn't measure anything """
+
+    def scrape_video_page(self, url, title):
+        return nodes.TopicNode(source_id=url, title=title)
+
+
+@contextmanager
+def fresh_chef(language):
+    """
+        Yields a chef set up with pre_run to build into its own temporary data directory
+        pre_run attaches the asset store and thumbnail renderer to the scrapers, so every
+        build gets new ones (and nothing is left pointing at a deleted directory)
+    """
+    data_dir = tempfile.mkdtemp()
+    try:
+        chef = BenchmarkChef(language=language)
+        chef.DATA_DIR = data_dir
+        chef.DOWNLOADS_DIR = os.path.join(data_dir, 'downloads')
+        chef.VIDEOS_DIR = os.path.join(data_dir, 'videos')
+        chef.ASSETS_DIR = os.path.join(data_dir, 'assets')
+        chef.THUMBNAILS_DIR = os.path.join(data_dir, 'thumbnails')
+        chef.IMAGES_DIR = os.path.join(data_dir, 'images')
+        chef.TRANSCODES_DIR = os.path.join(data_dir, 'transcodes')
+        chef.pre_run({}, {'rate_limit': '0'})  # Replayed responses don't need throttling
+        yield chef
+    finally:
+        if who.ThumbnailTag.thumbnail_renderer:
+            who.ThumbnailTag.thumbnail_renderer.shutdown()
+        who.ThumbnailTag.thumbnail_renderer = None
+        who.AssetStoreMixin.asset_store = None
+        shutil.rmtree(data_dir)
+
+
+def build_page(chef, url, language):
+    """ Builds a single topic page from scratch and returns the dispatcher with its tag timings """
+    scraper = who.WHOPageScraper(url, locale=language)
+    scraper.to_file(directory=chef.DOWNLOADS_DIR, overwrite=True)
+    return scraper.dispatcher
+
+
+def run(archive, language):
+    sushichef.use_archive(replay=archive)
+    results = {'archive': os.path.abspath(archive), 'language': language, 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'skipped': ['videos']}
+
+    with fresh_chef(language) as chef:
+        channel, seconds, peak = measure(lambda: chef.construct_channel(language=language))
+    results['build'] = {'seconds': seconds, 'peak_mb': peak}
+
+    # Time each topic page and add up how long each tag class took across them, and how much memory it kept
+    results['pages'] = {}
+    results['tags'] = defaultdict(lambda: {'seconds': 0.0, 'count': 0, 'memory_mb': 0.0})
+    for node in channel.children:
+        if node.kind == content_kinds.HTML5:
+            with fresh_chef(language) as chef:
+                dispatcher, seconds, peak = measure(lambda: build_page(chef, node.source_id, language))
+            results['pages'][node.source_id] = {'title': node.title, 'seconds': seconds, 'peak_mb': peak}
+            for name, tag_seconds in dispatcher.timings.items():
+                results['tags'][name]['seconds'] += tag_seconds
+                results['tags'][name]['count'] += dispatcher.counts[name]
+                results['tags'][name]['memory_mb'] += dispatcher.memory[name] / 1024 ** 2
+    return results
+
+
+def compare(results, previous):
+    """ Prints how results changed since previous """
+    def line(name, current, before):
+        change = (current['seconds'] - before['seconds']) / before['seconds'] * 100 if before['seconds'] else 0
+        print('{:<60} {:8.2f}s  {:+6.1f}%  {:8.1f}MB'.format(name[:60], current['seconds'], change, current.get('peak_mb', current.get('memory_mb', 0))))
+
+    print('Compared with {}'.format(previous['date']))
+    line('Full build', results['build'], previous['build'])
+    for url, page in results['pages'].items():
+        if url in previous['pages']:
+            line(page['title'], page, previous['pages'][url])
+    for name, tag in results['tags'].items():
+        if name in previous['tags']:
+            line(name, tag, previous['tags'][name])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the chef against recorded responses.')
+    parser.add_argument('archive', help='Archive recorded with ./sushichef.py --record.')
+    parser.add_argument('--language', default='en', help='Language to build.')
+    parser.add_argument('--compare', help='Earlier results file to compare with.')
+    args = parser.parse_args()
+
+    results = run(args.archive, args.language)
+
+    if not os.path.exists(RESULTS_DIR):
+        os.makedirs(RESULTS_DIR)
+    path = os.path.join(RESULTS_DIR, '{}-{}.json'.format(time.strftime('%Y%m%d-%H%M%S'), args.language))
+    with open(path, 'w') as fobj:
+        json.dump(results, fobj, indent=2)
+    print('Saved results to {}'.format(path))
+
+    if args.compare:
+        with open(args.compare) as fobj:
+            compare(results, json.load(fobj))
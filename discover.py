@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+    Checks which languages WHO has the advice page in, and which of them are missing
+    from SOURCE_MAP, without loading the chef (only the standard library is imported
+    unless the language selector can't be found by streaming the page)
+    Usage:
+        ./discover.py [--page saved.html]
+    Prints {"available": [...], "missing": [...], "removed": [...]} and exits with 1 if
+    any language is missing from SOURCE_MAP
+"""
+import argparse
+import codecs
+import json
+import re
+import sys
+
+from html.parser import HTMLParser
+
+from scrapers.sources import BASE_URL, SOURCE_MAP
+
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 6.1; WOW64; rv:20.0) Gecko/20100101 Firefox/20.0'  # Same as ricecooker
+CHUNK_SIZE = 16 * 1024                                                                    # Bytes to parse at a time
+
+
+class LanguageSelectorParser(HTMLParser):
+    """
+        Finds the languages in the page's language selector (ul.sf-lang-selector)
+        `done` is set once the selector closes, so the rest of the page doesn't need to be read
+    """
+
+    def __init__(self):
+        super(LanguageSelectorParser, self).__init__()
+        self.languages = []
+        self.depth = 0      # Number of open uls inside the selector (0 when outside it)
+        self.done = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'ul' and (self.depth or 'sf-lang-selector' in (attrs.get('class') or '').split()):
+            self.depth += 1
+        elif tag == 'a' and self.depth:
+            match = re.search(r"openLinkWithTranslation\('([^\']+)'\)", attrs.get('onclick') or '')
+            if match:
+                self.languages.append(match.group(1))
+
+    def handle_endtag(self, tag):
+        if tag == 'ul' and self.depth:
+            self.depth -= 1
+            self.done = not self.depth
+
+
+def read_languages(stream, encoding='utf-8'):
+    """
+        Returns the languages in the selector of an html stream (or None if there isn't one)
+        Args:
+            stream (file-like): binary stream of the page
+            encoding (str): encoding of the page
+    """
+    parser = LanguageSelectorParser()
+    decoder = codecs.getincrementaldecoder(encoding)('replace')
+    for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+        parser.feed(decoder.decode(chunk))
+        if parser.done:
+            return parser.languages
+    parser.close()
+    return parser.languages or None  # Selector was never closed (or wasn't found)
+
+
+def get_available_languages(page=None):
+    """
+        Returns the languages listed on the English advice page
+        Args:
+            page (str): saved copy of the page to read instead of downloading it
+    """
+    if page:
+        with open(page, 'rb') as fobj:
+            languages = read_languages(fobj)
+    else:
+        from urllib.request import Request, urlopen
+        request = Request(BASE_URL.format(language='en', endpoint=''), headers={'User-Agent': USER_AGENT})
+        with urlopen(request, timeout=60) as response:
+            languages = read_languages(response, response.headers.get_content_charset() or 'utf-8')
+
+    # The selector wasn't found in the stream (e.g. the markup is broken), so let the chef's parser try
+    if languages is None:
+        from bs4 import BeautifulSoup
+        import sushichef
+        if page:
+            with open(page, 'rb') as fobj:
+                return sushichef.parse_languages(BeautifulSoup(fobj.read(), sushichef.PARSER))
+        return sushichef.get_available_languages()
+    return languages
+
+
+def diff_languages(available):
+    """ Returns which available languages are missing from SOURCE_MAP, and which SOURCE_MAP languages are gone """
+    return {
+        'available': available,
+        'missing': [language for language in available if language not in SOURCE_MAP],
+        'removed': [language for language in SOURCE_MAP if language not in available],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check for languages that are missing from SOURCE_MAP.')
+    parser.add_argument('--page', help='Saved copy of the English advice page to read instead of downloading it.')
+    args = parser.parse_args()
+
+    diff = diff_languages(get_available_languages(page=args.page))
+    print(json.dumps(diff, indent=2))
+    sys.exit(int(bool(diff['missing'])))
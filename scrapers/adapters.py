@@ -0,0 +1,61 @@
+import threading
+
+from urllib.parse import urlparse
+from requests.adapters import BaseAdapter
+
+
+def wrap_session(session, wrapper, prefixes=('http://', 'https://')):
+    """
+        Wraps the adapters mounted on a session
+        Args:
+            session (requests.Session): session to modify (e.g. downloader.DOWNLOAD_SESSION)
+            wrapper (function): called with the current adapter, returns the new adapter
+            prefixes ([str]): url prefixes to wrap
+    """
+    for prefix in prefixes:
+        session.mount(prefix, wrapper(session.get_adapter(prefix)))
+
+
+class DelegatingAdapter(BaseAdapter):
+    """
+        Adapter that hands requests off to another adapter
+        Subclass this to add behavior around `send`
+    """
+    def __init__(self, adapter):
+        super(DelegatingAdapter, self).__init__()
+        self.adapter = adapter
+
+    def send(self, request, **kwargs):
+        return self.adapter.send(request, **kwargs)
+
+    def close(self):
+        self.adapter.close()
+
+
+class HostLimitAdapter(DelegatingAdapter):
+    """
+        Limits the number of requests in flight to each host
+        e.g. don't send more than 4 requests at a time to www.who.int
+    """
+    max_preload = 10 * 1024 ** 2  # Larger responses (e.g. videos) are streamed outside of the limit
+
+    def __init__(self, adapter, limit=4):
+        super(HostLimitAdapter, self).__init__(adapter)
+        self.limit = limit
+        self.semaphores = {}
+        self.lock = threading.Lock()
+
+    def get_semaphore(self, host):
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self.semaphores[host]
+
+    def send(self, request, **kwargs):
+        with self.get_semaphore(urlparse(request.url).netloc):
+            response = self.adapter.send(request, **kwargs)
+
+            # Read streamed bodies before letting the next request through
+            if int(response.headers.get('content-length') or 0) <= self.max_preload:
+                response.content
+            return response
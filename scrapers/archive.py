@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+from requests.exceptions import ConnectionError
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from scrapers.adapters import DelegatingAdapter
+
+
+class ResponseArchive(object):
+    """
+        Compact archive of http responses (sqlite file with zlib-compressed bodies,
+        stored once per content hash) for replaying runs without the live site
+    """
+    header_only_types = ('video/',)  # Only keep the headers for these content types
+
+    def __init__(self, path):
+        """
+            path (str): sqlite file to keep responses in
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with self.connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS responses (method TEXT, url TEXT, status INTEGER, reason TEXT, headers TEXT, hash TEXT, PRIMARY KEY (method, url))')
+            connection.execute('CREATE TABLE IF NOT EXISTS bodies (hash TEXT PRIMARY KEY, body BLOB)')
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=60)
+
+    def add(self, method, url, response):
+        """
+            Records response for url
+            Args:
+                method (str): request method (e.g. 'GET' or 'HEAD')
+                url (str): requested url
+                response (requests.Response): response to record
+        """
+        headers = dict(response.headers)
+        if response.headers.get('content-type', '').startswith(self.header_only_types):
+            body = b''
+        else:
+            body = response.content
+        digest = hashlib.sha256(body).hexdigest()
+
+        with self.lock, self.connect() as connection:
+            connection.execute('INSERT OR IGNORE INTO bodies VALUES (?, ?)', (digest, zlib.compress(body)))
+            connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                               (method, url, response.status_code, response.reason, json.dumps(headers), digest))
+
+    def get(self, method, url):
+        """ Returns (status, reason, headers, body) recorded for url (or None if it wasn't recorded) """
+        with self.connect() as connection:
+            row = connection.execute('SELECT status, reason, headers, body FROM responses JOIN bodies USING (hash) '
+                                     'WHERE method = ? AND url = ?', (method, url)).fetchone()
+        if row:
+            return row[0], row[1], json.loads(row[2]), zlib.decompress(row[3])
+
+    def urls(self, method='GET'):
+        with self.connect() as connection:
+            return [row[0] for row in connection.execute('SELECT url FROM responses WHERE method = ? ORDER BY url', (method,))]
+
+
+class RecordingAdapter(DelegatingAdapter):
+    """ Records every response that goes through it to a ResponseArchive """
+
+    def __init__(self, adapter, archive):
+        super(RecordingAdapter, self).__init__(adapter)
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        response = self.adapter.send(request, **kwargs)
+        self.archive.add(request.method, request.url, response)
+        return response
+
+
+class ReplayAdapter(DelegatingAdapter):
+    """
+        Serves responses from a ResponseArchive instead of the network
+        Urls that weren't recorded raise a ConnectionError, like a broken link would
+    """
+
+    def __init__(self, archive):
+        super(ReplayAdapter, self).__init__(None)
+        self.archive = archive
+
+    def send(self, request, **kwargs):
+        recorded = self.archive.get(request.method, request.url)
+        if not recorded:
+            raise ConnectionError('{} is not in the archive'.format(request.url), request=request)
+
+        status, reason, headers, body = recorded
+        response = Response()
+        response.status_code = status
+        response.reason = reason
+        response.url = request.url
+        response.request = request
+        response.headers = CaseInsensitiveDict(headers)
+        response.headers.pop('content-encoding', None)  # Bodies were recorded after decoding
+        response.headers.pop('transfer-encoding', None)
+        if body:
+            response.headers['content-length'] = str(len(body))
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
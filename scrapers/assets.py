@@ -0,0 +1,240 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from requests.exceptions import ConnectionError, RequestException
+from ricecooker.config import LOGGER
+from ricecooker.utils import downloader
+
+
+ASSET_ATTRIBUTES = ('src', 'data-src', 'data-image', 'href')  # Attributes that link to files
+PAGE_EXTENSIONS = ('', '.htm', '.html', '.aspx')               # Hrefs with these extensions link to pages, not files
+
+
+def is_asset(attribute, link):
+    """ Returns True if link is a file that would be downloaded into a zip """
+    if not link or link.startswith(('data:', '#', 'mailto:', 'javascript:')):
+        return False
+    if attribute != 'href':
+        return True
+    return os.path.splitext(link.split('?')[0].split('#')[0].rstrip('/'))[1].lower() not in PAGE_EXTENSIONS
+
+
+class AssetStore(object):
+    """
+        Content-addressed store for downloaded files (images, pdfs, etc.)
+        Files are saved under their sha256 hash, so the same binary linked from several
+        urls, pages or languages is only downloaded and stored once. An sqlite index maps
+        urls to hashes so several processes can share the store, and the least recently
+        used files are evicted once the store grows past max_bytes (down to evict_to of it,
+        so a full store isn't scanned again on every put)
+        Files are stored with their ETag/Last-Modified and revalidated with a conditional
+        request the first time they're read in a run, so updated files are downloaded again
+    """
+    evict_to = 0.9  # Fraction of max_bytes to evict down to
+
+    def __init__(self, directory, max_bytes=2 * 1024 ** 3):
+        """
+            directory (str): where to store files and the index
+            max_bytes (int): maximum size of the store before evicting files
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stats = {'hits': 0, 'misses': 0, 'bytes_saved': 0, 'bytes_downloaded': 0}
+        self.checked = set()  # Urls that have been downloaded or revalidated during this run
+        self.versions = {}    # url: ETag or Last-Modified from the server during this run
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        with self.connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS assets (url TEXT PRIMARY KEY, hash TEXT, size INTEGER, last_used REAL, etag TEXT, last_modified TEXT)')
+
+            # Stores created before validators were kept
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(assets)')]
+            for column in ('etag', 'last_modified'):
+                if column not in columns:
+                    connection.execute('ALTER TABLE assets ADD COLUMN {} TEXT'.format(column))
+            self.total = self.get_total(connection)  # Bytes stored (kept up to date by put and evict)
+
+    def connect(self):
+        return sqlite3.connect(os.path.join(self.directory, 'index.sqlite3'), timeout=60)
+
+    def get_total(self, connection):
+        """ Returns the number of bytes stored """
+        return connection.execute('SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM assets GROUP BY hash)').fetchone()[0]
+
+    def get_path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get_hash(self, url):
+        """ Returns the content hash stored for url (or None if it hasn't been downloaded) """
+        with self.connect() as connection:
+            row = connection.execute('SELECT hash FROM assets WHERE url = ?', (url,)).fetchone()
+        return row and row[0]
+
+    def get_validators(self, url):
+        """ Returns the (ETag, Last-Modified) stored for url """
+        with self.connect() as connection:
+            row = connection.execute('SELECT etag, last_modified FROM assets WHERE url = ?', (url,)).fetchone()
+        return row or (None, None)
+
+    def get(self, url):
+        """
+            Returns the stored contents of url (or None if it isn't in the store)
+            Args:
+                url (str): url of file
+        """
+        digest = self.get_hash(url)
+        if not digest:
+            return None
+        try:
+            with open(self.get_path(digest), 'rb') as fobj:
+                contents = fobj.read()
+        except FileNotFoundError:
+            return None  # Evicted (e.g. by another process) since the index was read
+        with self.connect() as connection:
+            connection.execute('UPDATE assets SET last_used = ? WHERE hash = ?', (time.time(), digest))
+        return contents
+
+    def put(self, url, contents, headers=None):
+        """
+            Adds contents to the store under url
+            Args:
+                url (str): url contents were downloaded from
+                contents (bytes): file contents
+                headers (dict): response headers to keep the validators from
+            Returns content hash
+        """
+        headers = headers or {}
+        digest = hashlib.sha256(contents).hexdigest()
+        path = self.get_path(digest)
+        if not os.path.exists(path):
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+            with open(tmp_path, 'wb') as fobj:
+                fobj.write(contents)
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.total += len(contents)
+
+        with self.connect() as connection:
+            connection.execute('INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?)',
+                               (url, digest, len(contents), time.time(), headers.get('etag'), headers.get('last-modified')))
+        if self.total > self.max_bytes:
+            self.evict()
+        return digest
+
+    def revalidate(self, url):
+        """
+            Asks the server whether the stored copy of url has changed, the first time it's read during this run
+            Returns the response if it has (None if the stored copy can still be used)
+            Args:
+                url (str): url of stored file
+        """
+        with self.lock:
+            if url in self.checked:
+                return None
+            self.checked.add(url)
+
+        etag, last_modified = self.get_validators(url)
+        if not etag and not last_modified:
+            return None  # Nothing to check with (WHO changes the url when a file is updated)
+
+        # no-cache so the request isn't answered by ricecooker's forever cache
+        headers = dict(downloader.DEFAULT_HEADERS, **{'Cache-Control': 'no-cache'})
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        try:
+            response = downloader.DOWNLOAD_SESSION.get(url, headers=headers, timeout=60)
+        except RequestException as e:
+            LOGGER.warning('Unable to check {} for changes ({})'.format(url, str(e)))
+            return None
+
+        # Keep the stored copy on a 304 (or the forever cache's copy of it) and on errors
+        if response.status_code == 200 and not getattr(response, 'from_cache', False):
+            return response
+        response.close()
+        return None
+
+    def read(self, url):
+        """
+            Returns contents of url, only downloading it if it isn't already in the store
+            (or it has changed since it was stored)
+            Args:
+                url (str): url to read
+        """
+        contents = self.get(url)
+        response = None if contents is None else self.revalidate(url)
+        if contents is not None and response is None:
+            with self.lock:
+                self.stats['hits'] += 1
+                self.stats['bytes_saved'] += len(contents)
+            return contents
+
+        if response is None:
+            response = downloader.make_request(url)
+            if response is None:
+                raise ConnectionError('Could not connect to {}'.format(url))
+
+        # Only keep successful responses so error pages don't get stored
+        contents = response.content
+        if response.status_code == 200:
+            self.put(url, contents, headers=response.headers)
+        with self.lock:
+            self.checked.add(url)
+            self.stats['misses'] += 1
+            self.stats['bytes_downloaded'] += len(contents)
+        return contents
+
+    def get_version(self, url):
+        """
+            Returns the ETag (or Last-Modified) the server has for url now, from a HEAD request,
+            so pages can tell whether a file they link to has changed without downloading it
+            Returns None if the server doesn't send either (or can't be reached)
+            Args:
+                url (str): url of file
+        """
+        with self.lock:
+            if url in self.versions:
+                return self.versions[url]
+
+        version = None
+        try:
+            response = downloader.DOWNLOAD_SESSION.head(url, headers=downloader.DEFAULT_HEADERS, allow_redirects=True, timeout=30)
+            if response.status_code == 200:
+                version = response.headers.get('etag') or response.headers.get('last-modified')
+        except RequestException as e:
+            LOGGER.warning('Unable to check {} for changes ({})'.format(url, str(e)))
+
+        with self.lock:
+            self.versions[url] = version
+        return version
+
+    def evict(self):
+        """ Removes least recently used files until the store is under evict_to of max_bytes """
+        with self.lock, self.connect() as connection:
+            rows = connection.execute('SELECT hash, MAX(size), MAX(last_used) FROM assets GROUP BY hash ORDER BY MAX(last_used)').fetchall()
+            total = sum(size for _, size, _ in rows)
+            for digest, size, _ in rows:
+                if total <= self.max_bytes * self.evict_to:
+                    break
+                connection.execute('DELETE FROM assets WHERE hash = ?', (digest,))
+                if os.path.exists(self.get_path(digest)):
+                    os.remove(self.get_path(digest))
+                total -= size
+                LOGGER.debug('Evicted {} from asset store'.format(digest))
+            self.total = total
+
+    def report(self):
+        """ Returns a summary of how the store was used during this run """
+        return 'Asset store: {hits} hits, {misses} misses, {saved:.1f}MB saved, {downloaded:.1f}MB downloaded'.format(
+            hits=self.stats['hits'],
+            misses=self.stats['misses'],
+            saved=self.stats['bytes_saved'] / 1024 ** 2,
+            downloaded=self.stats['bytes_downloaded'] / 1024 ** 2,
+        )
@@ -0,0 +1,71 @@
+import json
+import os
+import threading
+
+from hashlib import md5
+
+
+def hash_file(path):
+    """ Returns the md5 of the file at path """
+    digest = md5()
+    with open(path, 'rb') as fobj:
+        for chunk in iter(lambda: fobj.read(1024 ** 2), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CheckpointLog(object):
+    """
+        Appends a line to a jsonl file for every node as soon as it's built, so a run
+        that crashes can be resumed without scraping the finished nodes again
+        e.g. {"source_id": "https://www.who.int/...", "kind": "html5", "title": "...", "path": "...", "hash": "..."}
+    """
+
+    def __init__(self, path, resume=False):
+        """
+            path (str): jsonl file to keep checkpoints in
+            resume (bool): use the checkpoints from the last run (otherwise start a new log)
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        if resume and os.path.exists(path):
+            with open(path) as fobj:
+                for line in fobj:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Last line of a run that crashed while writing
+                    self.entries[entry['source_id']] = entry
+        else:
+            open(path, 'w').close()
+
+    def get(self, source_id, kind):
+        """
+            Returns the checkpoint for source_id (or None if it needs to be built)
+            Checkpoints are ignored if their file has changed or gone missing since
+            Args:
+                source_id (str): source_id of node
+                kind (str): content kind of node
+        """
+        entry = self.entries.get(source_id)
+        if entry and entry['kind'] == kind and os.path.exists(entry['path']) and hash_file(entry['path']) == entry['hash']:
+            return entry
+
+    def add(self, source_id, kind, title, path):
+        """
+            Records a finished node
+            Args:
+                source_id (str): source_id of node
+                kind (str): content kind of node
+                title (str): title of node
+                path (str): path to node's file
+        """
+        entry = {'source_id': source_id, 'kind': kind, 'title': title, 'path': path, 'hash': hash_file(path)}
+        with self.lock:
+            self.entries[source_id] = entry
+            with open(self.path, 'a') as fobj:
+                fobj.write(json.dumps(entry) + '\n')
@@ -0,0 +1,160 @@
+import time
+import tracemalloc
+
+from collections import defaultdict
+from bs4.element import Tag
+
+
+def compile_selector(selector):
+    """
+        Returns (tag name, attrs) for a BeautifulSoup selector
+        e.g. ('div', {'class': 'sf-image'}) or ('script',)
+    """
+    return selector[0], (selector[1] if len(selector) > 1 else {})
+
+
+def matches(element, attrs):
+    """ Returns True if element has attrs (same rules as BeautifulSoup's find_all) """
+    for key, value in attrs.items():
+        actual = element.get(key)
+        if actual is None:
+            return False
+        if isinstance(actual, list):
+            if value not in actual and ' '.join(actual) != value:
+                return False
+        elif actual != value:
+            return False
+    return True
+
+
+def is_attached(element, root):
+    """ Returns True if element is still in the tree (hasn't been replaced or decomposed) """
+    while element.parent is not None:
+        element = element.parent
+    return element is root
+
+
+class TagDispatcher(object):
+    """
+        Finds the elements for every tag class and omit selector in a single walk of the tree,
+        then processes them in the same order as running find_all for each one in turn:
+            1. Elements matching the omit list are decomposed (their children aren't visited)
+            2. Each tag class processes its elements in priority order, skipping any that an
+               earlier tag has already replaced or removed (or marked with skip-scrape)
+        After each element is processed, whatever is left in its place is checked for unmarked
+        elements that later tag classes would find (e.g. a replacement with a new img), and if
+        there are any the tree is walked again for the remaining tag classes, as find_all would.
+        Tags that add elements anywhere else in the tree still need to mark them with mark_tag_to_skip
+    """
+
+    def __init__(self, tag_classes, omit_list=None):
+        """
+            tag_classes ([BasicScraperTag]): tag classes in the order they should be processed
+            omit_list ([tuple]): selectors for elements to remove
+        """
+        self.tag_classes = tag_classes
+        self.timings = defaultdict(float)  # Seconds spent processing each tag class
+        self.counts = defaultdict(int)     # Number of elements processed by each tag class
+        self.memory = defaultdict(int)     # Bytes each tag class left allocated (only while tracemalloc is tracing)
+
+        # Index selectors by tag name so each element is only checked against selectors that could match
+        self.table = defaultdict(list)
+        for attrs in (compile_selector(selector) for selector in omit_list or []):
+            self.table[attrs[0]].append((None, attrs[1]))
+        for index, tag_class in enumerate(tag_classes):
+            name, attrs = compile_selector(tag_class.selector)
+            self.table[name].append((index, attrs))
+
+    def collect(self, contents, omit=True):
+        """
+            Walks the tree once to find elements to omit and elements for each tag class
+            Args:
+                contents (BeautifulSoup): tree to walk
+                omit (bool): check the omit selectors (only done once, before any tags are processed)
+            Returns (elements to omit, [elements for each tag class])
+        """
+        omitted = []
+        buckets = [[] for _ in self.tag_classes]
+        stack = list(reversed(contents.contents))
+        while stack:
+            element = stack.pop()
+            if not isinstance(element, Tag):
+                continue
+
+            selectors = self.table.get(element.name)
+            if selectors:
+                if omit and any(index is None and matches(element, attrs) for index, attrs in selectors):
+                    omitted.append(element)
+                    continue
+                for index, attrs in selectors:
+                    if index is not None and matches(element, attrs):
+                        buckets[index].append(element)
+
+            stack.extend(reversed(element.contents))
+        return omitted, buckets
+
+    def get_region(self, parent, previous, following):
+        """ Returns the nodes in parent between previous and following (None if those have moved too) """
+        if any(sibling is not None and sibling.parent is not parent for sibling in (previous, following)):
+            return None
+        node = previous.next_sibling if previous is not None else next(iter(parent.contents), None)
+        nodes = []
+        while node is not None and node is not following:
+            nodes.append(node)
+            node = node.next_sibling
+        return nodes
+
+    def has_new_elements(self, nodes, after, known):
+        """
+            Returns True if nodes contain elements for tag classes after `after` that weren't collected
+            Args:
+                nodes ([PageElement]): nodes to check (and their descendants)
+                after (int): index of the tag class being processed
+                known (set): ids of the collected elements
+        """
+        stack = list(reversed(nodes))
+        while stack:
+            element = stack.pop()
+            if not isinstance(element, Tag):
+                continue
+            if id(element) not in known and 'skip-scrape' not in (element.get('class') or []):
+                for index, attrs in self.table.get(element.name, []):
+                    if index is not None and index > after and matches(element, attrs):
+                        return True
+            stack.extend(reversed(element.contents))
+        return False
+
+    def run(self, contents, create_scraper):
+        """
+            Removes omitted elements and processes all tags in contents
+            Args:
+                contents (BeautifulSoup): tree to process
+                create_scraper (function): called with (tag class, element), returns the tag scraper
+        """
+        omitted, buckets = self.collect(contents)
+        for element in omitted:
+            element.decompose()
+        known = set(id(element) for elements in buckets for element in elements)
+
+        traced = tracemalloc.is_tracing()
+        for position, tag_class in enumerate(self.tag_classes):
+            allocated = traced and tracemalloc.get_traced_memory()[0]
+            start = time.time()
+            changed = False
+            for element in buckets[position]:
+                if is_attached(element, contents):
+                    parent, previous, following = element.parent, element.previous_sibling, element.next_sibling
+                    create_scraper(tag_class, element).scrape()
+                    self.counts[tag_class.__name__] += 1
+
+                    # Check what the tag left in the element's place for elements the next tag classes would find
+                    if not changed:
+                        region = self.get_region(parent, previous, following)
+                        changed = region is None or self.has_new_elements(region, position, known)
+
+            if changed:
+                buckets[position + 1:] = self.collect(contents, omit=False)[1][position + 1:]
+                known = set(id(element) for elements in buckets for element in elements)
+            self.timings[tag_class.__name__] += time.time() - start
+            if traced:
+                self.memory[tag_class.__name__] += tracemalloc.get_traced_memory()[0] - allocated
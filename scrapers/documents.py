@@ -0,0 +1,55 @@
+import threading
+
+from bs4 import BeautifulSoup
+from ricecooker.utils import downloader
+
+from scrapers.stats import STATS
+
+
+class DocumentCache(object):
+    """
+        Keeps the pages downloaded during a run so each one is only fetched
+        (and, for read-only callers, parsed) once
+    """
+
+    def __init__(self):
+        self.contents = {}  # url: raw bytes
+        self.trees = {}     # (url, parser): parsed BeautifulSoup
+        self.lock = threading.Lock()
+
+    def read(self, url):
+        """
+            Returns the raw contents of url
+            Args:
+                url (str): url to read
+        """
+        if url not in self.contents:
+            contents = downloader.read(url)
+            with self.lock:
+                self.contents.setdefault(url, contents)
+        return self.contents[url]
+
+    def parse(self, url, parser='html5lib'):
+        """
+            Returns a parsed tree of url that is shared between callers,
+            so it must not be modified (use `read` to get a tree you can change)
+            Args:
+                url (str): url to parse
+                parser (str): BeautifulSoup parser to use (e.g. 'html5lib' or 'lxml')
+        """
+        key = (url, parser)
+        if key not in self.trees:
+            contents = self.read(url)
+            with STATS.stage('parse'):
+                contents = BeautifulSoup(contents, parser)
+            with self.lock:
+                self.trees.setdefault(key, contents)
+        return self.trees[key]
+
+    def clear(self):
+        with self.lock:
+            self.contents.clear()
+            self.trees.clear()
+
+
+DOCUMENTS = DocumentCache()  # Shared by the chef and scrapers for the whole run
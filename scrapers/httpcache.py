@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import threading
+
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from scrapers.adapters import DelegatingAdapter
+
+
+class RevalidatingCacheAdapter(DelegatingAdapter):
+    """
+        Keeps responses on disk along with their validators (ETag/Last-Modified)
+        and sends conditional requests, so pages that haven't changed come back
+        as a 304 and are served from disk instead of being downloaded again.
+        Pages that were already checked during this run are served straight from disk
+        e.g. session.mount('https://www.who.int/', RevalidatingCacheAdapter(HTTPAdapter(), 'chefdata/httpcache'))
+    """
+    cache_types = ('text/html',)  # Only cache these content types (binaries are handled by the asset store)
+
+    def __init__(self, adapter, directory):
+        """
+            adapter (requests.adapters.BaseAdapter): adapter to send requests with
+            directory (str): where to store cached responses
+        """
+        super(RevalidatingCacheAdapter, self).__init__(adapter)
+        self.directory = directory
+        self.counters = {'200': 0, '304': 0, 'hits': 0}
+        self.checked = set()  # Urls that have been downloaded or revalidated during this run
+        self.lock = threading.Lock()
+
+    def get_path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def load(self, url):
+        """ Returns (metadata, body) stored for url (or None if it isn't cached) """
+        path = self.get_path(url)
+        if not os.path.exists(path + '.json') or not os.path.exists(path + '.body'):
+            return None
+        with open(path + '.json') as fobj:
+            metadata = json.load(fobj)
+        with open(path + '.body', 'rb') as fobj:
+            return metadata, fobj.read()
+
+    def save(self, url, response):
+        """ Writes response to disk if it has a validator to revalidate it with """
+        headers = {key: value for key, value in response.headers.items() if key.lower() in ('etag', 'last-modified', 'content-type')}
+        if not any(key.lower() in ('etag', 'last-modified') for key in headers):
+            return
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory, exist_ok=True)
+
+        # Write to temporary files first so readers never see a partial entry
+        path = self.get_path(url)
+        suffix = '.{}.{}.tmp'.format(os.getpid(), threading.get_ident())
+        with open(path + '.body' + suffix, 'wb') as fobj:
+            fobj.write(response.content)
+        with open(path + '.json' + suffix, 'w') as fobj:
+            json.dump({'url': url, 'headers': headers}, fobj)
+        os.replace(path + '.body' + suffix, path + '.body')
+        os.replace(path + '.json' + suffix, path + '.json')
+
+    def build_response(self, request, metadata, body):
+        """ Creates a 200 response from a cached entry """
+        response = Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.url = request.url
+        response.request = request
+        response.headers = CaseInsensitiveDict(metadata['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = body
+        response._content_consumed = True
+        response.connection = self
+        return response
+
+    def send(self, request, **kwargs):
+        if request.method != 'GET':
+            return self.adapter.send(request, **kwargs)
+
+        cached = self.load(request.url)
+        if cached and request.url in self.checked:
+            self.count('hits')
+            return self.build_response(request, *cached)
+
+        # Ask the server to only send the page if it has changed
+        if cached:
+            metadata = CaseInsensitiveDict(cached[0]['headers'])
+            if metadata.get('etag'):
+                request.headers['If-None-Match'] = metadata['etag']
+            if metadata.get('last-modified'):
+                request.headers['If-Modified-Since'] = metadata['last-modified']
+
+        response = self.adapter.send(request, **kwargs)
+
+        if response.status_code == 304 and cached:
+            self.count('304')
+            self.checked.add(request.url)
+            response.close()
+            return self.build_response(request, *cached)
+
+        if response.status_code == 200:
+            self.count('200')
+            content_type = response.headers.get('content-type', '')
+            if any(content_type.startswith(cache_type) for cache_type in self.cache_types):
+                self.save(request.url, response)
+                self.checked.add(request.url)
+
+        return response
+
+    def report(self):
+        """ Returns a summary of how the cache was used """
+        return 'HTTP cache: {} downloaded (200), {} not modified (304), {} already checked this run'.format(
+            self.counters['200'], self.counters['304'], self.counters['hits'])
@@ -0,0 +1,136 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import zipfile
+
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from PIL import Image
+from ricecooker.config import LOGGER
+
+from scrapers.zipper import WHOZipWriter
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def optimize_image(contents, max_width, quality):
+    """
+        Returns contents resized to max_width and recompressed (run in a worker process)
+        The original is returned if the optimized image isn't any smaller
+        Args:
+            contents (bytes): png or jpeg image
+            max_width (int): maximum width to display image at
+            quality (int): jpeg quality to save with
+    """
+    try:
+        image = Image.open(BytesIO(contents))
+        image_format = image.format
+        if image_format not in ('PNG', 'JPEG'):
+            return contents
+
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+
+        output = BytesIO()
+        if image_format == 'JPEG':
+            image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(output, 'PNG', optimize=True)
+        optimized = output.getvalue()
+    except (OSError, Image.DecompressionBombError, ValueError) as e:
+        # Broken images, svgs saved as .png and error pages are kept as they are
+        LOGGER.warning('Unable to optimize image ({})'.format(str(e)))
+        return contents
+    return optimized if len(optimized) < len(contents) else contents
+
+
+class ImageOptimizer(object):
+    """
+        Resizes and recompresses the images in html zips so they're smaller to download
+        Images are optimized in a process pool and cached by their content hash
+        The pool uses the spawn context, as its workers are started from the scraping threads
+    """
+
+    def __init__(self, directory, max_width=1200, quality=85, workers=None):
+        """
+            directory (str): where to cache optimized images
+            max_width (int): maximum width to display images at
+            quality (int): jpeg quality to save with
+            workers (int): number of processes to optimize with (defaults to number of cores)
+        """
+        self.directory = directory
+        self.max_width = max_width
+        self.quality = quality
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.results = []  # (title, size before, size after) for each zip
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get_path(self, contents):
+        digest = hashlib.sha256(contents).hexdigest()
+        return os.path.join(self.directory, '{}-{}-{}'.format(digest, self.max_width, self.quality))
+
+    def optimize(self, images):
+        """
+            Returns optimized versions of images
+            Args:
+                images ([bytes]): images to optimize
+        """
+        optimized = [None] * len(images)
+        uncached = []
+        for index, contents in enumerate(images):
+            path = self.get_path(contents)
+            if os.path.exists(path):
+                with open(path, 'rb') as fobj:
+                    optimized[index] = fobj.read()
+            else:
+                uncached.append(index)
+
+        if uncached:
+            contents = [images[index] for index in uncached]
+            results = self.executor.map(optimize_image, contents, [self.max_width] * len(contents), [self.quality] * len(contents))
+            for index, result in zip(uncached, results):
+                optimized[index] = result
+                path = self.get_path(images[index])
+                tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+                with open(tmp_path, 'wb') as fobj:
+                    fobj.write(result)
+                os.replace(tmp_path, path)
+        return optimized
+
+    def optimize_zip(self, path, title=None):
+        """
+            Replaces the images in a zip with optimized versions
+            Args:
+                path (str): zip to optimize
+                title (str): name to use for zip in report
+        """
+        before = os.path.getsize(path)
+
+        # Rewrite with the same writer the scrapers use so the zip stays deterministic
+        with zipfile.ZipFile(path) as zf, WHOZipWriter(path) as zipper:
+            images = []
+            for info in zf.infolist():
+                if info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                    images.append(info.filename)
+                else:
+                    zipper.write_contents(info.filename, zf.read(info), dedupe=False)
+            for filename, contents in zip(images, self.optimize([zf.read(filename) for filename in images])):
+                zipper.write_contents(filename, contents, dedupe=False)
+
+        with self.lock:
+            self.results.append((title or os.path.basename(path), before, os.path.getsize(path)))
+
+    def report(self):
+        """ Returns the size of each zip before and after optimizing images """
+        lines = ['Image optimization:']
+        for title, before, after in self.results:
+            lines.append('    {}: {:.2f}MB -> {:.2f}MB'.format(title, before / 1024 ** 2, after / 1024 ** 2))
+        return '\n'.join(lines)
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,49 @@
+import json
+import os
+import threading
+
+
+class BuildManifest(object):
+    """
+        Records which zip was built for each source_id and a fingerprint of what it
+        was built from, so pages that haven't changed can reuse the zip from the last run
+        e.g. {"https://www.who.int/...": {"fingerprint": "...", "path": "chefdata/downloads/....zip"}}
+    """
+
+    def __init__(self, path):
+        """
+            path (str): json file to keep the manifest in
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as fobj:
+                self.entries = json.load(fobj)
+
+    def get(self, source_id, fingerprint):
+        """
+            Returns the path to the zip built for source_id (or None if it needs to be rebuilt)
+            Args:
+                source_id (str): source_id of node
+                fingerprint (str): fingerprint of the current source
+        """
+        entry = self.entries.get(source_id)
+        if entry and entry['fingerprint'] == fingerprint and os.path.exists(entry['path']):
+            return entry['path']
+
+    def set(self, source_id, fingerprint, path):
+        """
+            Records the zip built for source_id and saves the manifest
+            Args:
+                source_id (str): source_id of node
+                fingerprint (str): fingerprint of the source the zip was built from
+                path (str): path to zip
+        """
+        with self.lock:
+            self.entries[source_id] = {'fingerprint': fingerprint, 'path': path}
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with open(self.path + '.tmp', 'w') as fobj:
+                json.dump(self.entries, fobj, indent=2, sort_keys=True)
+            os.replace(self.path + '.tmp', self.path)
@@ -0,0 +1,129 @@
+import json
+import os
+import time
+
+from bs4 import BeautifulSoup
+from concurrent.futures import ThreadPoolExecutor
+from ricecooker.config import LOGGER
+from ricecooker.utils import downloader
+from webmixer.scrapers.tags import LinkTag
+
+from scrapers import who
+from scrapers.assets import ASSET_ATTRIBUTES, is_asset
+from scrapers.documents import DOCUMENTS
+
+
+PAGE_LINK_TAGS = (LinkTag, who.ExternalLinkTag)  # Tags that only turn links into copy link messages
+
+
+def find_assets(url, language=None):
+    """
+        Returns the files each tag on a page would download ({url: tag class name})
+        The page is read from the document cache and its tags are found with the page
+        scraper's dispatcher, but nothing is processed, downloaded or written
+        Args:
+            url (str): WHO page to check
+            language (str): language of page
+    """
+    scraper = who.WHOPageScraper(url, locale=language)
+    contents = BeautifulSoup(DOCUMENTS.read(url), scraper.parser)
+    scraper.preprocess(contents)
+    _, buckets = scraper.dispatcher.collect(contents)
+
+    assets = {}
+    for tag_class, elements in zip(scraper.dispatcher.tag_classes, buckets):
+        if tag_class in PAGE_LINK_TAGS:
+            continue
+        for element in elements:
+            for tag in [element] + element.find_all(True):
+                for attribute in ASSET_ATTRIBUTES:
+                    link = tag.get(attribute)
+                    if isinstance(link, str) and is_asset(attribute, link.strip()):
+                        assets.setdefault(who.format_url(link.strip()), tag_class.__name__)
+    return assets
+
+
+def head(url):
+    """ Returns the size, type and status of url from a HEAD request (without downloading it) """
+    try:
+        response = downloader.DOWNLOAD_SESSION.head(url, headers=downloader.DEFAULT_HEADERS, allow_redirects=True, timeout=30)
+        size = response.headers.get('content-length')
+        return {
+            'size': int(size) if size else None,
+            'type': response.headers.get('content-type', '').split(';')[0],
+            'status': response.status_code,
+        }
+    except Exception as e:
+        return {'size': None, 'type': None, 'status': str(e)}
+
+
+def make_plan(language, topics, videos, pages, workers=8):
+    """
+        Returns the plan for a language: its topics, videos and the files its pages link to
+        Args:
+            language (str): language code
+            topics ({url: title}): topics on the main page
+            videos ({url: title}): videos on the videos page
+            pages ([str]): pages that would be scraped to zips
+            workers (int): number of HEAD requests to send at once
+    """
+    assets = {}
+    for page in pages:
+        for url, tag in find_assets(page, language=language).items():
+            assets.setdefault(url, {'tag': tag, 'pages': []})['pages'].append(page)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for url, info in zip(list(assets), executor.map(head, list(assets))):
+            assets[url].update(info)
+
+    return {
+        'language': language,
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'topics': topics,
+        'videos': videos,
+        'assets': assets,
+        'size': sum(asset['size'] or 0 for asset in assets.values()),
+    }
+
+
+def diff_plans(previous, current, sections=('topics', 'videos', 'assets')):
+    """ Returns what was added to and removed from each section since the previous plan """
+    changes = {}
+    for section in sections:
+        before = set(previous.get(section) or [])
+        after = set(current.get(section) or [])
+        changes[section] = {'added': sorted(after - before), 'removed': sorted(before - after)}
+    return changes
+
+
+def save_plan(plan, path, sections=('topics', 'videos', 'assets')):
+    """
+        Writes plan to path, and returns the changes since the plan that was there before
+        (everything is added if there wasn't one)
+        Args:
+            plan (dict): plan to save
+            path (str): json file to save plan to
+            sections ([str]): sections of plan to compare
+    """
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as fobj:
+            previous = json.load(fobj)
+    plan['changes'] = diff_plans(previous, plan, sections=sections)
+
+    if not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path + '.tmp', 'w') as fobj:
+        json.dump(plan, fobj, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    return plan['changes']
+
+
+def log_changes(name, changes):
+    for section, change in changes.items():
+        if change['added'] or change['removed']:
+            LOGGER.info('  {} {}: {} added, {} removed'.format(name, section, len(change['added']), len(change['removed'])))
+            for item in change['added']:
+                LOGGER.info('    + {}'.format(item))
+            for item in change['removed']:
+                LOGGER.info('    - {}'.format(item))
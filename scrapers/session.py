@@ -0,0 +1,223 @@
+import random
+import threading
+import time
+
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+from scrapers.adapters import DelegatingAdapter, HostLimitAdapter
+
+
+class TokenBucket(object):
+    """
+        Lets requests through at `rate` per second, with bursts of up to `burst`
+        The rate is halved whenever the host pushes back (429 or 5xx) and creeps
+        back up to the starting rate as requests succeed
+    """
+
+    def __init__(self, rate, burst=None, min_rate=0.5):
+        """
+            rate (float): requests per second to start at (and never go above)
+            burst (int): number of requests that can go out at once (defaults to rate)
+            min_rate (float): lowest rate to slow down to
+        """
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst or max(1, int(rate))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """ Waits until a request can go out """
+        while True:
+            with self.lock:
+                self.refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        with self.lock:
+            self.refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0)  # Don't let a saved-up burst through straight away
+
+    def speed_up(self):
+        with self.lock:
+            self.refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class RateLimiter(object):
+    """ Keeps a TokenBucket for each host, shared by every adapter it's used in """
+
+    def __init__(self, rate, burst=None):
+        """
+            rate (float): requests per second to send to each host
+            burst (int): number of requests that can go out to a host at once
+        """
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+        self.counts = Counter()  # status or event: count
+        self.lock = threading.Lock()
+
+    def get_bucket(self, host):
+        with self.lock:
+            if host not in self.buckets:
+                self.buckets[host] = TokenBucket(self.rate, burst=self.burst)
+            return self.buckets[host]
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def report(self):
+        lines = ['Rate limiting: {} throttled, {} server errors, {} retries'.format(
+            self.counts['429'], self.counts['5xx'], self.counts['retry'])]
+        for host, bucket in sorted(self.buckets.items()):
+            if bucket.rate < bucket.max_rate:
+                lines.append('    {}: slowed to {:.1f} requests/s'.format(host, bucket.rate))
+        return '\n'.join(lines)
+
+
+class RateLimitAdapter(DelegatingAdapter):
+    """
+        Sends requests through a RateLimiter and retries GET/HEAD requests that were
+        throttled (429) or failed on the server (5xx), waiting for the Retry-After
+        header if there is one and for a jittered exponential backoff otherwise
+        It goes right above the transport (below any caches), so only requests that go
+        out to the network use up tokens, and the HostLimitAdapter it wraps is only
+        held while a request is in flight (not while waiting to retry it)
+    """
+    retry_methods = ('GET', 'HEAD')
+    retry_statuses = (429, 500, 502, 503, 504)
+    max_wait = 60  # Longest Retry-After to honor (in seconds)
+
+    def __init__(self, adapter, limiter, retries=3, backoff=1.0):
+        """
+            adapter (requests.adapters.BaseAdapter): adapter to send requests with
+            limiter (RateLimiter): limiter to share between adapters
+            retries (int): number of times to retry a throttled request
+            backoff (float): base delay between retries (in seconds)
+        """
+        super(RateLimitAdapter, self).__init__(adapter)
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+
+    def get_delay(self, response, attempt):
+        """ Returns how long to wait before retrying response """
+        retry_after = response.headers.get('retry-after')
+        if retry_after:
+            try:
+                return min(self.max_wait, max(0, float(retry_after)))
+            except ValueError:
+                try:
+                    return min(self.max_wait, max(0, parsedate_to_datetime(retry_after).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, self.backoff * 2 ** attempt)  # Full jitter
+
+    def is_cached(self, request):
+        """ Returns True if the transport will answer request from its own cache (e.g. ricecooker's CacheControl adapter) """
+        controller = getattr(get_transport(self.adapter), 'controller', None)
+        return bool(controller and request.method == 'GET' and controller.cached_request(request))
+
+    def send(self, request, **kwargs):
+        if self.is_cached(request):
+            return get_transport(self.adapter).send(request, **kwargs)
+
+        bucket = self.limiter.get_bucket(urlparse(request.url).netloc)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            response = self.adapter.send(request, **kwargs)
+            if response.status_code not in self.retry_statuses:
+                bucket.speed_up()
+                return response
+
+            bucket.slow_down()
+            self.limiter.count('429' if response.status_code == 429 else '5xx')
+            if request.method not in self.retry_methods or attempt >= self.retries:
+                return response
+
+            delay = self.get_delay(response, attempt)
+            response.close()
+            self.limiter.count('retry')
+            time.sleep(delay)
+            attempt += 1
+
+
+def get_transport(adapter):
+    """ Returns the HTTPAdapter at the bottom of a stack of DelegatingAdapters (or None) """
+    while isinstance(adapter, DelegatingAdapter):
+        adapter = adapter.adapter
+    return adapter if isinstance(adapter, HTTPAdapter) else None
+
+
+def configure_session(session, limiter=None, host_limit=4, prefixes=('http://', 'https://')):
+    """
+        Sets up a session so connections are kept alive and reused, with at most
+        host_limit requests in flight to each host, and optionally rate limits it
+        The limits go right above each transport, so responses served by a cache above it
+        (e.g. HTTP_CACHE) don't wait for them
+        Args:
+            session (requests.Session): session to configure (e.g. downloader.DOWNLOAD_SESSION)
+            limiter (RateLimiter): limiter to send requests through
+            host_limit (int): maximum number of requests in flight to each host
+            prefixes ([str]): url prefixes to configure
+    """
+    limited = {}  # id(transport): adapter (so prefixes that share a transport share its limits)
+    for prefix in prefixes:
+        parent, adapter = None, session.get_adapter(prefix)
+        while isinstance(adapter, DelegatingAdapter):
+            parent, adapter = adapter, adapter.adapter
+        if not isinstance(adapter, HTTPAdapter) or isinstance(parent, HostLimitAdapter):
+            continue  # Nothing goes to the network (e.g. replaying), or it's already configured
+
+        if id(adapter) not in limited:
+            # Size each pool to the number of requests we let through to a host at once, so
+            # connections are never thrown away for being over the limit. The pool doesn't
+            # block (requests can't pass it a pool timeout), as HostLimitAdapter already waits
+            if adapter._pool_maxsize != host_limit or adapter._pool_block:
+                adapter.init_poolmanager(adapter._pool_connections, host_limit)
+            limited[id(adapter)] = HostLimitAdapter(adapter, limit=host_limit)
+            if limiter:
+                limited[id(adapter)] = RateLimitAdapter(limited[id(adapter)], limiter)
+
+        if parent:
+            parent.adapter = limited[id(adapter)]
+        else:
+            session.mount(prefix, limited[id(adapter)])
+
+
+def connection_report(session, prefixes=('http://', 'https://')):
+    """ Returns the number of requests and connections made to each host (to see how many connections were reused) """
+    sent = Counter()
+    connections = Counter()
+    transports = {id(transport): transport for transport in map(get_transport, map(session.get_adapter, prefixes)) if transport}
+    for transport in transports.values():
+        pools = transport.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool:
+                sent[pool.host] += pool.num_requests
+                connections[pool.host] += pool.num_connections
+
+    lines = ['Connections:']
+    for host, count in sent.most_common():
+        reused = (1 - connections[host] / count) * 100 if count else 0
+        lines.append('    {}: {} requests over {} connections ({:.0f}% reused)'.format(host, count, connections[host], reused))
+    return '\n'.join(lines)
@@ -0,0 +1,52 @@
+# Sources for each language, kept apart from sushichef.py so they can be read
+# without loading ricecooker (e.g. by discover.py)
+BASE_URL = 'https://www.who.int/{language}/emergencies/diseases/novel-coronavirus-2019/advice-for-public/{endpoint}'
+SOURCE_MAP = {
+    'en': {
+        'description': 'Stay aware of the latest information on the COVID-19 outbreak, ' +
+                        'available on the WHO website and through your national and local ' +
+                        'public health authority. Most countries around the world have '+
+                        'seen cases of COVID-19 and many are experiencing outbreaks. ' +
+                        'Authorities in China and some other countries have succeeded in ' +
+                        'slowing their outbreaks. However, the situation is unpredictable ' +
+                        'so check regularly for the latest news.',
+    },
+    'ar': {
+        'description': "احرص على متابعة آخر المستجدات عن فاشية مرض كوفيد-19، على ال" +
+                       "موقع الإلكتروني لمنظمة الصحة العالمية ومن خلال سلطات الصحة ال" +
+                       "عامة المحلية والوطنية. وفي حين لا تزال عدوى كوفيد-19 متفشية ف" +
+                       "ي الصين بشكل أساسي، فهناك بعض بؤر التفشي في بلدان أخرى.  و" +
+                       "معظم الأفرادلذين يصابون بالعدوى يشعرون بأعراض خفيفة ويتعافون، و" +
+                       "لكن الأعراض قد تظهر بشكل أكثر حدة لدى غيرهم. احرص على العناية ب"  +
+                       "صحتك وحماية الآخرين بواسطة التدابير التالية:",
+    },
+    'es': {
+        'description': "Manténgase al día de la información más reciente sobre el brote de COVID-19," +
+                       " a la que puede acceder en el sitio web de la OMS y a través de las autoridades" +
+                       " de salud pública pertinentes a nivel nacional y local. La COVID-19 sigue afectando " +
+                       "principalmente a la población de China, aunque se han producido brotes en otros " +
+                       "países. La mayoría de las personas que se infectan padecen una enfermedad leve y se " +
+                       "recuperan, pero en otros casos puede ser más grave.",
+    },
+    'fr': {
+        'description': "Tenez-vous au courant des dernières informations sur la flambée de COVID-19, " +
+                       "disponibles sur le site Web de l’OMS et auprès des autorités de santé publique " +
+                       "nationales et locales. La COVID-19 continue de toucher surtout la population de " +
+                       "la Chine, même si des flambées sévissent dans d’autres pays. La plupart des " +
+                       "personnes infectées présentent des symptômes bénins et guérissent, mais d’autres " +
+                       "peuvent avoir une forme plus grave.",
+    },
+    'zh': {
+        'description': "请随时了解世卫组织网站上以及您所在国家和地方公共卫生机构提供的关于2019冠状病毒病疫情的最新信息。" +
+                       "世界上大多数国家都出现了COVID-19病例，许多国家正发生疫情。中国和其他一些国家已经成功地减缓了疫情。" +
+                       "但是，这种情况不可预测，因此请定期查看最新消息。",
+    },
+    'ru': {
+        'description': "Следите за новейшей информацией о вспышке COVID-19, которую можно найти на веб-сайте ВОЗ, " +
+                       "а также получить от органов общественного здравоохранения вашей страны и населенного пункта." +
+                       " Наибольшее число случаев COVID-19 по-прежнему выявлено в Китае, тогда как в других странах " +
+                       "отмечаются вспышки локального характера. В большинстве случаев заболевание характеризуется " +
+                       "легким течением и заканчивается выздоровлением, хотя встречаются осложнения.",
+    },
+}
+BLACKLIST = ['healthy-parenting']                           # Topics that aren't scraped
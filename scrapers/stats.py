@@ -0,0 +1,115 @@
+import cProfile
+import json
+import os
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager
+
+from scrapers.adapters import DelegatingAdapter
+
+
+class RunStats(object):
+    """
+        Collects wall time, bytes transferred and counts for each stage of a run
+        (fetching, parsing, tag processing, asset downloads, zipping and videos)
+        and writes them to a json report. Recording only takes a timer and a lock,
+        so it's always on
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profile_url = None   # Page to run under cProfile
+        self.profile_path = None  # Where to write the profile
+        self.reset()
+
+    def reset(self):
+        """ Starts collecting stats for a new run """
+        self.start = time.time()
+        self.stages = defaultdict(lambda: {'seconds': 0.0, 'count': 0})
+        self.tags = defaultdict(lambda: {'seconds': 0.0, 'count': 0})
+        self.urls = defaultdict(lambda: {'seconds': 0.0, 'bytes': 0, 'count': 0, 'status': None})
+
+    @contextmanager
+    def stage(self, name):
+        """
+            Times a stage of the run
+            e.g. with STATS.stage('parse'): ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.stages[name]['seconds'] += elapsed
+                self.stages[name]['count'] += 1
+
+    def add_transfer(self, url, seconds, size, status):
+        with self.lock:
+            self.urls[url]['seconds'] += seconds
+            self.urls[url]['bytes'] += size
+            self.urls[url]['count'] += 1
+            self.urls[url]['status'] = status
+
+    def add_tags(self, dispatcher):
+        """ Adds the tag class timings from a TagDispatcher """
+        with self.lock:
+            for name, seconds in dispatcher.timings.items():
+                self.tags[name]['seconds'] += seconds
+                self.tags[name]['count'] += dispatcher.counts[name]
+
+    def call(self, url, function):
+        """ Calls function, running it under cProfile if url is the page to profile """
+        if not self.profile_url or url != self.profile_url:
+            return function()
+        profile = cProfile.Profile()
+        try:
+            return profile.runcall(function)
+        finally:
+            profile.dump_stats(self.profile_path)
+
+    def write(self, path, **info):
+        """
+            Writes the report to a json file
+            Args:
+                path (str): where to write the report
+                info: anything else to include in the report (e.g. language)
+        """
+        with self.lock:
+            report = dict(info,
+                seconds=time.time() - self.start,
+                bytes=sum(url['bytes'] for url in self.urls.values()),
+                stages=dict(self.stages),
+                tags=dict(self.tags),
+                urls=dict(self.urls),
+            )
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fobj:
+            json.dump(report, fobj, indent=2, sort_keys=True)
+
+
+class InstrumentedAdapter(DelegatingAdapter):
+    """ Records the time, size and status of every request in a RunStats """
+
+    def __init__(self, adapter, stats):
+        super(InstrumentedAdapter, self).__init__(adapter)
+        self.stats = stats
+
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        with self.stats.stage('fetch'):
+            response = self.adapter.send(request, **kwargs)
+
+        # Streamed bodies that haven't been read yet are counted by their content-length
+        if response._content_consumed and response._content:
+            size = len(response._content)
+        else:
+            size = int(response.headers.get('content-length') or 0)
+        self.stats.add_transfer(request.url, time.perf_counter() - start, size, response.status_code)
+        return response
+
+
+STATS = RunStats()  # Stats for this process (each language runs in its own process)
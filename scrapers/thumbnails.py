@@ -0,0 +1,109 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+
+from collections import defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from pdf2image import convert_from_bytes
+from ricecooker.config import LOGGER
+
+
+def render_pdf_thumbnail(contents, dpi):
+    """
+        Returns the first page of a pdf as png bytes (run in a worker process)
+        Args:
+            contents (bytes): pdf to render
+            dpi (int): resolution to render at
+    """
+    page = convert_from_bytes(contents, dpi=dpi, first_page=1, last_page=1)[0]
+    output = BytesIO()
+    page.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+class ThumbnailRenderer(object):
+    """
+        Renders the first page of pdfs to use as their preview images
+        Pages are rendered in a process pool while the rest of the page is being scraped,
+        and cached by the pdf's content hash so unchanged pdfs are never rendered again
+        The pool is created up front with the spawn context, as its workers are started
+        from the scraping threads and forking a threaded process can deadlock
+    """
+    max_dpi = 72  # Thumbnails are displayed small, so don't render at a higher resolution than this
+
+    def __init__(self, directory, dpi=50, workers=None):
+        """
+            directory (str): where to cache rendered thumbnails
+            dpi (int): resolution to render at (capped at max_dpi)
+            workers (int): number of processes to render with (defaults to number of cores)
+        """
+        self.directory = directory
+        self.dpi = min(dpi, self.max_dpi)
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.pending = defaultdict(list)  # id(zipper): [(filename, directory, future)]
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def render(self, contents):
+        """
+            Starts rendering a pdf (or reads it from the cache)
+            Args:
+                contents (bytes): pdf to render
+            Returns (content hash, future with png bytes)
+        """
+        digest = hashlib.sha256(contents).hexdigest()
+        path = os.path.join(self.directory, '{}-{}.png'.format(digest, self.dpi))
+        if os.path.exists(path):
+            future = Future()
+            with open(path, 'rb') as fobj:
+                future.set_result(fobj.read())
+            return digest, future
+
+        future = self.executor.submit(render_pdf_thumbnail, contents, self.dpi)
+        future.add_done_callback(lambda done: self.save(path, done))
+        return digest, future
+
+    def save(self, path, future):
+        # Each writer gets its own temporary file, as languages share the thumbnails directory
+        if future.exception() is None:
+            tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+            with open(tmp_path, 'wb') as fobj:
+                fobj.write(future.result())
+            os.replace(tmp_path, path)
+
+    def write(self, zipper, contents, directory='img'):
+        """
+            Adds a thumbnail of a pdf to zipper once it has been rendered (see flush)
+            Args:
+                zipper (WHOZipWriter): zip to write thumbnail to
+                contents (bytes): pdf to render
+                directory (str): directory in zip to write thumbnail to
+            Returns path to thumbnail in zip
+        """
+        digest, future = self.render(contents)
+        filename = '{}.png'.format(digest)
+        with self.lock:
+            self.pending[id(zipper)].append((filename, directory, future))
+        return '{}/{}'.format(directory, filename)
+
+    def flush(self, zipper):
+        """
+            Waits for thumbnails for zipper to finish rendering and writes them to the zip
+            Args:
+                zipper (WHOZipWriter): zip to write thumbnails to
+        """
+        with self.lock:
+            pending = self.pending.pop(id(zipper), [])
+        for filename, directory, future in pending:
+            try:
+                # The page already links to this name, so don't let the zip point it at another copy
+                zipper.write_contents(filename, future.result(), directory=directory, dedupe=False)
+            except Exception as e:
+                LOGGER.warning('Unable to render pdf thumbnail {} ({})'.format(filename, str(e)))
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from ricecooker.config import LOGGER
+from ricecooker.utils import downloader
+
+
+def save_hash(path, digest):
+    """ Records the sha256 of the file at path next to it, along with the size and mtime it was taken at """
+    stat = os.stat(path)
+    with open(path + '.sha256', 'w') as fobj:
+        json.dump({'sha256': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}, fobj)
+
+
+def file_hash(path, chunk_size=1024 ** 2):
+    """
+        Returns the sha256 of the file at path
+        The hash is kept in a path + '.sha256' sidecar, so it's only read in full again
+        if the file's size or modification time has changed
+    """
+    stat = os.stat(path)
+    try:
+        with open(path + '.sha256') as fobj:
+            saved = json.load(fobj)
+        if (saved['size'], saved['mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+            return saved['sha256']
+    except (OSError, ValueError, KeyError):
+        pass
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fobj:
+        for chunk in iter(lambda: fobj.read(chunk_size), b''):
+            digest.update(chunk)
+    save_hash(path, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def get_validator(response):
+    """ Returns the ETag or Last-Modified to send as If-Range (weak ETags can't be used for ranges) """
+    etag = response.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('last-modified')
+
+
+def download_resumable(url, write_to_path, chunk_size=1024 ** 2):
+    """
+        Downloads url to write_to_path, picking up from where an interrupted download left off
+        The file is written to write_to_path + '.part' and only renamed once it is complete,
+        so a file at write_to_path is never partial. The video's ETag (or Last-Modified) and
+        length are kept next to the part file, and sent as If-Range so a video that changed
+        since is downloaded from the start. Its sha256 is taken while it's written (see file_hash)
+        Args:
+            url (str): url to download
+            write_to_path (str): where to write the file
+            chunk_size (int): number of bytes to write at a time
+    """
+    part_path = write_to_path + '.part'
+    info_path = part_path + '.json'
+    try:
+        with open(info_path) as fobj:
+            info = json.load(fobj)
+    except (OSError, ValueError):
+        info = {}
+
+    # Only resume part files we know the version of
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) and info.get('validator') else 0
+    headers = dict(downloader.DEFAULT_HEADERS, **{'Accept-Encoding': 'identity'})  # Offsets need to match the file
+    if offset:
+        headers['Range'] = 'bytes={}-'.format(offset)
+        headers['If-Range'] = info['validator']
+
+    response = downloader.DOWNLOAD_SESSION.get(url, headers=headers, stream=True, timeout=60)
+
+    if offset and response.status_code == 416:
+        response.close()
+
+        # The part file already has everything
+        if info.get('length') == offset:
+            os.replace(part_path, write_to_path)
+            os.remove(info_path)
+            file_hash(write_to_path)
+            return
+
+        # The part file is longer than the video now, so start over
+        LOGGER.info('Restarting {} ({:.1f}MB part file doesn\'t match the video)'.format(url, offset / 1024 ** 2))
+        os.remove(part_path)
+        return download_resumable(url, write_to_path, chunk_size=chunk_size)
+
+    response.raise_for_status()
+    digest = hashlib.sha256()
+    if offset and response.status_code == 206:
+        LOGGER.info('Resuming {} from {:.1f}MB'.format(url, offset / 1024 ** 2))
+        mode = 'ab'
+        with open(part_path, 'rb') as fobj:
+            for chunk in iter(lambda: fobj.read(chunk_size), b''):
+                digest.update(chunk)
+    else:
+        # Server doesn't support ranges or the video changed, so start over
+        mode = 'wb'
+        length = response.headers.get('content-length')
+        with open(info_path, 'w') as fobj:
+            json.dump({'validator': get_validator(response), 'length': int(length) if length else None}, fobj)
+
+    with open(part_path, mode) as fobj:
+        for chunk in response.iter_content(chunk_size):
+            fobj.write(chunk)
+            digest.update(chunk)
+    os.replace(part_path, write_to_path)
+    os.remove(info_path)
+    save_hash(write_to_path, digest.hexdigest())
+
+
+def transcode_video(source, write_to_path, height, crf, audio_bitrate):
+    """
+        Transcodes a video with ffmpeg
+        Videos are scaled down to height (never up) and written as h264/aac mp4
+        Args:
+            source (str): path to video
+            write_to_path (str): where to write transcoded video
+            height (int): maximum height of video
+            crf (int): x264 quality (higher is smaller)
+            audio_bitrate (str): aac bitrate (e.g. '64k')
+    """
+    tmp_path = write_to_path + '.tmp.mp4'
+    process = subprocess.run([
+        'ffmpeg', '-y', '-loglevel', 'error', '-i', source,
+        '-vf', "scale=-2:'min({},ih)'".format(height),
+        '-c:v', 'libx264', '-preset', 'medium', '-crf', str(crf), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', audio_bitrate,
+        '-movflags', '+faststart',
+        tmp_path,
+    ], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if process.returncode != 0:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise RuntimeError(process.stderr.strip() or 'ffmpeg exited with {}'.format(process.returncode))
+    os.replace(tmp_path, write_to_path)
+
+
+class Transcoder(object):
+    """
+        Transcodes videos to a low resolution profile so they're smaller to download
+        ffmpeg runs in its own process, so videos are transcoded from threads (at most `workers`
+        at a time), either the calling thread or the transcoder's own pool so downloads aren't
+        held up (see ContentNodeMixin.submit_contentnode), and cached by the source file's sha256
+        and the profile, so the same video downloaded for another language isn't transcoded again
+    """
+
+    def __init__(self, directory, height=480, crf=28, audio_bitrate='64k', workers=None):
+        """
+            directory (str): where to cache transcoded videos
+            height (int): maximum height of videos
+            crf (int): x264 quality (higher is smaller)
+            audio_bitrate (str): aac bitrate
+            workers (int): number of videos to transcode at once (defaults to number of cores)
+        """
+        self.directory = directory
+        self.height = height
+        self.crf = crf
+        self.audio_bitrate = audio_bitrate
+        self.workers = workers or os.cpu_count()
+        self.semaphore = threading.BoundedSemaphore(self.workers)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.results = []  # (title, size before, size after, seconds) for each video
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+    @classmethod
+    def available(cls):
+        return shutil.which('ffmpeg') is not None
+
+    @property
+    def profile(self):
+        return '{}p-crf{}-{}'.format(self.height, self.crf, self.audio_bitrate)
+
+    def get_path(self, path):
+        """ Returns where to cache the transcoded copy of path (see file_hash) """
+        return os.path.join(self.directory, '{}-{}.mp4'.format(file_hash(path), self.profile))
+
+    def transcode(self, path, title=None):
+        """
+            Returns the path to a transcoded copy of the video at path
+            The original is returned if transcoding fails or doesn't make the video smaller
+            Args:
+                path (str): video to transcode
+                title (str): name to use for video in report
+        """
+        write_to_path = self.get_path(path)
+        start = time.time()
+        if not os.path.exists(write_to_path):
+            try:
+                with self.semaphore:
+                    transcode_video(path, write_to_path, self.height, self.crf, self.audio_bitrate)
+            except (OSError, RuntimeError) as e:
+                LOGGER.warning('Unable to transcode {} ({})'.format(path, str(e)))
+                return path
+
+        before, after = os.path.getsize(path), os.path.getsize(write_to_path)
+        with self.lock:
+            self.results.append((title or os.path.basename(path), before, min(before, after), time.time() - start))
+        return write_to_path if after < before else path
+
+    def shutdown(self):
+        """ Waits for transcodes submitted to the pool to finish """
+        self.executor.shutdown()
+
+    def report(self):
+        """ Returns the time spent and size saved transcoding each video """
+        lines = ['Video transcoding ({}):'.format(self.profile)]
+        for title, before, after, seconds in self.results:
+            lines.append('    {}: {:.2f}MB -> {:.2f}MB, saved {:.2f}MB ({:.1f}s)'.format(
+                title, before / 1024 ** 2, after / 1024 ** 2, (before - after) / 1024 ** 2, seconds))
+        return '\n'.join(lines)
+
@@ -1,35 +1,164 @@
 import os
+import re
+import youtube_dl
 
 from bs4 import BeautifulSoup
+from concurrent.futures import Future
+from hashlib import md5
 from le_utils.constants import content_kinds
 from ricecooker.classes import nodes, files
+from ricecooker.config import LOGGER
+from ricecooker.utils import downloader
 from webmixer.scrapers.pages.base import PDFScraper, HTMLPageScraper, VideoScraper, WebVideoScraper
 from webmixer.scrapers.pages.fullscreen import FullscreenPageScraper
-from webmixer.scrapers.tags import LinkTag
+from webmixer.exceptions import UnscrapableSourceException
+from webmixer.scrapers.tags import COMMON_TAGS, LinkTag
 from webmixer.utils import get_absolute_url
 
+from scrapers.assets import ASSET_ATTRIBUTES, is_asset
+from scrapers.dispatch import TagDispatcher
+from scrapers.documents import DOCUMENTS
+from scrapers.stats import STATS
+from scrapers.videos import download_resumable
+from scrapers.zipper import WHOZipWriter
+
+
+# Fingerprints include every module that shapes the zips, so they get rebuilt whenever that code changes
+SCRAPER_MODULES = ('who.py', 'dispatch.py', 'documents.py', 'zipper.py', 'images.py', 'thumbnails.py')
+SCRAPER_VERSION = md5()
+for module in SCRAPER_MODULES:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), module), 'rb') as fobj:
+        SCRAPER_VERSION.update(fobj.read())
+SCRAPER_VERSION = SCRAPER_VERSION.hexdigest()
+
+
+def format_url(url):
+    # web-prod urls don't work, so replace with regular www
+    return get_absolute_url('https://www.who.int', url).replace('https://web-prod', 'https://www')
+
+
+def create_node(kind, source_id, title, filepath, **kwargs):
+    """
+        Creates a node for a built file (shared by new and resumed nodes so they come out the same)
+        Args:
+            kind (str): content kind of node
+            source_id (str): source_id of node
+            title (str): title of node
+            filepath (str): path to node's file
+            kwargs: any other node fields (e.g. license)
+    """
+    # Generate a node based on the kind
+    if kind == content_kinds.HTML5:
+        return nodes.HTML5AppNode(
+            source_id=source_id,
+            title=title,
+            files=[files.HTMLZipFile(filepath)],
+            **kwargs
+        )
+    elif kind == content_kinds.VIDEO:
+        return nodes.VideoNode(
+            source_id=source_id,
+            title=title,
+            files=[files.VideoFile(filepath)],
+            **kwargs
+        )
+
 
 class ContentNodeMixin:
+    manifest = None         # Set to a BuildManifest to reuse zips from pages that haven't changed
+    image_optimizer = None  # Set to an ImageOptimizer to shrink the images in html zips
+    checkpoints = None      # Set to a CheckpointLog to record finished nodes (and skip ones finished before a crash)
+    transcoder = None       # Set to a Transcoder to shrink videos
+
     def to_contentnode(self, title, directory=None, *args, **kwargs):
-        # Generate a node based on the kind attribute
-        filepath = self.to_file(directory=directory)
-        if self.kind == content_kinds.HTML5:
-            return nodes.HTML5AppNode(
-                source_id=self.url,
-                title=title,
-                files=[files.HTMLZipFile(filepath)],
-                **kwargs
-            )
-        elif self.kind == content_kinds.VIDEO:
-            return nodes.VideoNode(
-                source_id=self.url,
-                title=title,
-                files=[files.VideoFile(filepath)],
-                **kwargs
-            )
-
-
-class ThumbnailTag(LinkTag):
+        checkpoint = self.checkpoints and self.checkpoints.get(self.url, self.kind)
+        if checkpoint:
+            LOGGER.debug('Resuming {} from checkpoint'.format(self.url))
+            return create_node(self.kind, self.url, title, checkpoint['path'], **kwargs)
+
+        return self.add_node(title, self.build_file(directory=directory, title=title), **kwargs)
+
+    def submit_contentnode(self, title, directory=None, **kwargs):
+        """
+            Like to_contentnode, but returns a future for the node
+            Videos are downloaded in the calling thread and transcoded in the transcoder's pool,
+            so download threads can move on to the next video while ffmpeg runs
+        """
+        if not self.transcoder or self.kind != content_kinds.VIDEO or (self.checkpoints and self.checkpoints.get(self.url, self.kind)):
+            future = Future()
+            future.set_result(self.to_contentnode(title, directory=directory, **kwargs))
+            return future
+
+        with STATS.stage('to_file.{}'.format(self.kind)):
+            filepath = self.to_file(directory=directory)
+
+        def transcode():
+            with STATS.stage('transcode'):
+                return self.add_node(title, self.transcoder.transcode(filepath, title=title), **kwargs)
+        return self.transcoder.executor.submit(transcode)
+
+    def add_node(self, title, filepath, **kwargs):
+        """ Creates the node for a built file and records it as finished """
+        node = create_node(self.kind, self.url, title, filepath, **kwargs)
+        if self.checkpoints:
+            self.checkpoints.add(self.url, self.kind, title, filepath)
+        return node
+
+    def get_fingerprint(self):
+        """ Returns a hash of everything the file is built from (None to always rebuild) """
+        return None
+
+    def build_file(self, directory=None, title=None):
+        """
+            Returns the path to the file for this node, reusing the one from the
+            last run if the source hasn't changed since
+            Args:
+                directory (str): directory to write file to
+                title (str): title of node (used for reporting)
+        """
+        fingerprint = self.manifest and self.get_fingerprint()
+        if fingerprint and self.image_optimizer:
+            fingerprint += '-{}-{}'.format(self.image_optimizer.max_width, self.image_optimizer.quality)
+        if not fingerprint:
+            with STATS.stage('to_file.{}'.format(self.kind)):
+                filepath = self.to_file(directory=directory)
+            return self.postprocess_file(filepath, title=title)
+
+        filepath = self.manifest.get(self.url, fingerprint)
+        if filepath:
+            LOGGER.debug('Reusing {} for unchanged page {}'.format(filepath, self.url))
+            return filepath
+
+        with STATS.stage('to_file.{}'.format(self.kind)):
+            filepath = self.to_file(directory=directory, overwrite=True)
+        filepath = self.postprocess_file(filepath, title=title)
+        self.manifest.set(self.url, fingerprint, filepath)
+        return filepath
+
+    def postprocess_file(self, filepath, title=None):
+        """ Runs optional stages on a newly built file (returns the path to the final file) """
+        if self.image_optimizer and self.kind == content_kinds.HTML5:
+            with STATS.stage('optimize_images'):
+                self.image_optimizer.optimize_zip(filepath, title=title)
+        if self.transcoder and self.kind == content_kinds.VIDEO:
+            with STATS.stage('transcode'):
+                filepath = self.transcoder.transcode(filepath, title=title)
+        return filepath
+
+
+class AssetStoreMixin:
+    """
+        Reads files from the shared asset store before going to the network (see scrapers.assets.AssetStore)
+        Files written to zips with write_url are read through the store by WHOZipWriter
+    """
+    asset_store = None  # Set to an AssetStore to share downloads between zips and languages
+
+    def read_url(self, url):
+        """ Returns the contents of url """
+        return self.asset_store.read(url) if self.asset_store else downloader.read(url)
+
+
+class ThumbnailTag(AssetStoreMixin, LinkTag):
     default_ext = '.png'                       # Automatically write files to have extension png
     directory = "img"                          # Write files to img folder in zip
     selector = ('div', {'class': 'sf-image'})  # Process elements with this selector
@@ -39,6 +168,9 @@ class ThumbnailTag(LinkTag):
     # preview page to the zipfile for the given file type (self.link)
     extra_scrapers = [FullscreenPageScraper]
 
+    # Set to a ThumbnailRenderer to use the first page of linked pdfs as their preview image
+    thumbnail_renderer = None
+
     def process(self):
         # Replace images with linked images
         self.link = self.get_link()
@@ -54,8 +186,7 @@ class ThumbnailTag(LinkTag):
     ##### Helper functions #####
 
     def format_url(self, url):
-        # web-prod urls don't work, so replace with regular www
-        return get_absolute_url('https://www.who.int', url).replace('https://web-prod', 'https://www')
+        return format_url(url)
 
     def get_link(self):
         # Try to use the image if possible, otherwise use the immediate child or parent link
@@ -86,7 +217,7 @@ class ThumbnailTag(LinkTag):
         # Download images to zipfile if they haven't been downloaded already
         img_url = img.get('data-src') or img.get('src')
         if not img_url.startswith('img'):
-            img['src'] = self.write_url(self.format_url(img_url), directory='img')
+            img['src'] = self.write_image(self.format_url(img_url))
         img['style'] = []  # Some images have a display: none rule, so get rid of those
         self.mark_tag_to_skip(img)  # Add class so other tags don't try to scrape it again
 
@@ -95,6 +226,15 @@ class ThumbnailTag(LinkTag):
         div_tag.append(link_tag)
         return div_tag
 
+    def write_image(self, url):
+        """
+            Writes the image at url to the zip
+            Some previews point to pdfs (e.g. infographics without a thumbnail), so render the first page of those
+        """
+        if self.thumbnail_renderer and url.split('?')[0].lower().endswith('.pdf'):
+            return self.thumbnail_renderer.write(self.zipper, self.read_url(url), directory='img')
+        return self.write_url(url, directory='img')
+
 
 class HighlightWidgetTag(ThumbnailTag):
     """
@@ -221,6 +361,8 @@ class WHOPageScraper(HTMLPageScraper, ContentNodeMixin):
 
     color = "#008DC9"           # Generate copy link text in WHO blue
     scrape_subpages = False     # If there are links on the page, don't scrape those linked pages
+    parser = 'html.parser'      # Parser to use for the page (html.parser is better at handling special characters)
+    single_pass = True          # Find all tags in one walk of the page instead of a find_all for each selector
 
     # Other tags to look out for (will use if the selector matches)
     # Order determines which ones should be scraped first
@@ -241,6 +383,12 @@ class WHOPageScraper(HTMLPageScraper, ContentNodeMixin):
     ]
 
 
+    def __init__(self, *args, **kwargs):
+        # HTMLPageScraper extends omit_list in place, so give each page its own copy
+        self.omit_list = list(self.omit_list)
+        super(WHOPageScraper, self).__init__(*args, **kwargs)
+        self.dispatcher = TagDispatcher(self.extra_tags + COMMON_TAGS, omit_list=self.omit_list)
+
     @classmethod
     def test(self, url):
         """ test if this scraper can be used on this url """
@@ -257,16 +405,106 @@ class WHOPageScraper(HTMLPageScraper, ContentNodeMixin):
         main_row = contents.find('div', {'class': 'row'})
         main_row['class'].append('sf-body')
 
+    def process(self):
+        # Read page through the document cache, as the chef has usually downloaded it already
+        contents = DOCUMENTS.read(self.url)
+        with STATS.stage('parse'):
+            contents = BeautifulSoup(contents, self.parser)
+
+        self.preprocess(contents)
+
+        # Remove omitted items and scrape tags in a single walk of the page
+        if self.single_pass:
+            self.dispatcher.run(contents, self.create_tag_scraper)
+            STATS.add_tags(self.dispatcher)
+        else:
+            for item in self.omit_list:
+                for element in contents.find_all(*item):
+                    element.decompose()
+            for tag_class in (self.extra_tags + COMMON_TAGS):
+                for tag in contents.find_all(*tag_class.selector):
+                    self.create_tag_scraper(tag_class, tag).scrape()
+
+        self.postprocess(contents)
+
+        with STATS.stage('prettify'):
+            return contents.prettify(formatter="minimal").encode('utf-8-sig', 'ignore')
+
+    def download_file(self, write_to_path):
+        # Same as HTMLPageScraper.download_file, but only store each file once per zip
+        with WHOZipWriter(write_to_path, asset_store=AssetStoreMixin.asset_store) as zipper:
+            try:
+                self.zipper = zipper
+                self.to_zip(filename='index.html')
+            except Exception as e:
+                LOGGER.error(str(e))
+
+    def to_zip(self, filename=None):
+        try:
+            return STATS.call(self.url, lambda: super(WHOPageScraper, self).to_zip(filename=filename))
+        finally:
+            # Add any pdf thumbnails that were rendered while the page was being scraped
+            if ThumbnailTag.thumbnail_renderer:
+                ThumbnailTag.thumbnail_renderer.flush(self.zipper)
+
+    def create_tag_scraper(self, tag_class, tag):
+        return tag_class(tag, self.url,
+            zipper=self.zipper,
+            scrape_subpages=self.scrape_subpages,
+            triaged=self.triaged,
+            locale=self.locale,
+            extra_scrapers=self.scrapers,
+            color=self.color
+        )
+
     def to_tag(self, *args):
         """ Don't do anything for to_tag method """
         return self.create_tag('div')
 
+    def get_fingerprint(self):
+        """
+            Returns a hash of the normalized page html, the files it links to and the thumbnail settings
+            Linked files are identified by the ETag/Last-Modified the server has for them now,
+            falling back to the url (WHO changes the url when a file is updated)
+        """
+        html = DOCUMENTS.read(self.url).decode('utf-8', 'ignore')
+
+        # Remove anything that changes between requests without changing the content
+        html = re.sub(r'<script.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
+        html = re.sub(r'<input[^>]*type="hidden"[^>]*>', '', html, flags=re.IGNORECASE)
+        html = re.sub(r'\s+', ' ', html)
+
+        fingerprint = md5(SCRAPER_VERSION.encode('utf-8'))
+        fingerprint.update(html.encode('utf-8'))
+        renderer = ThumbnailTag.thumbnail_renderer
+        fingerprint.update('thumbnails-{}'.format(renderer.dpi if renderer else 'off').encode('utf-8'))
+
+        asset_store = AssetStoreMixin.asset_store
+        links = re.findall(r'({})="([^"]+)"'.format('|'.join(ASSET_ATTRIBUTES)), html)
+        for url in sorted(set(format_url(link.strip()) for attribute, link in links if is_asset(attribute, link.strip()))):
+            fingerprint.update(((asset_store and asset_store.get_version(url)) or url).encode('utf-8'))
+        return fingerprint.hexdigest()
+
 
 class WHOVideoScraper(VideoScraper, ContentNodeMixin):
-    # Subclassing to take advantage of ContentNodeMixin
-    pass
+    def download_file(self, write_to_path):
+        # Resume interrupted downloads and only write to write_to_path once the video is complete
+        download_resumable(self.url, write_to_path)
 
 
 class WHOWebVideoScraper(WebVideoScraper, ContentNodeMixin):
-    # Subclassing to take advantage of ContentNodeMixin
-    pass
+    def download_file(self, write_to_path):
+        # youtube_dl downloads to a .part file and renames it when it's done,
+        # so let it continue from the .part file if the last run was interrupted
+        try:
+            dl_settings = {
+                'outtmpl': write_to_path,
+                'quiet': True,
+                'continuedl': True,
+                'nopart': False,
+                'format': self.default_ext.split('.')[-1],
+            }
+            with youtube_dl.YoutubeDL(dl_settings) as ydl:
+                ydl.download([self.url])
+        except (youtube_dl.utils.DownloadError, youtube_dl.utils.ExtractorError) as e:
+            raise UnscrapableSourceException(str(e))  # Some errors are region-specific, so allow link
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from ricecooker.config import LOGGER
+from ricecooker.utils import downloader, html_writer
+
+from scrapers.stats import STATS
+
+
+class WHOZipWriter(html_writer.HTMLWriter):
+    """
+        HTMLWriter that writes the same zip for the same files, and only stores each file once
+        - Entries are spooled to a temporary directory and written in sorted order with a
+          fixed timestamp when the zip is closed, so they aren't held in memory and the order
+          they were scraped in doesn't change the zip
+        - Files that are already compressed (images, videos, pdfs) are stored as they are,
+          everything else is deflated
+        - Files are stored under their content hash (keeping their directory and extension),
+          so a file with the same contents as one that's already in the zip isn't written again
+          and every tag that uses it links to the same name, whichever order they were scraped in
+        - Linked files are read through the asset store when there is one, so every tag that
+          writes a url (including webmixer's COMMON_TAGS) shares downloads between zips
+    """
+    date_time = (2013, 3, 14, 1, 59, 26)  # Same timestamp ricecooker's HTMLWriter uses
+    stored_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.mp4', '.webm', '.mp3', '.pdf', '.zip', '.woff', '.woff2')
+
+    def __init__(self, *args, asset_store=None, **kwargs):
+        """
+            asset_store (scrapers.assets.AssetStore): store to read linked files from (optional)
+        """
+        super(WHOZipWriter, self).__init__(*args, **kwargs)
+        self.asset_store = asset_store
+        self.entries = {}     # path in zip: path to spooled file
+        self.names = {}       # path asked for: path in zip it was stored under
+        self.duplicates = 0   # Number of files that weren't written again
+        self.saved = 0        # Bytes that weren't written again
+        self.spool = None
+
+    def get_name(self, filepath, contents):
+        """
+            Returns the path to store contents under: the content hash in the same directory
+            and with the same extension as filepath (so relative links from html pages still work)
+            e.g. img/photo.JPG -> img/<sha256>.jpg
+        """
+        digest = hashlib.sha256(contents if isinstance(contents, bytes) else contents.encode('utf-8')).hexdigest()
+        directory, filename = os.path.split(filepath)
+        name = digest + os.path.splitext(filename)[1].lower()
+        return '{}/{}'.format(directory, name) if directory else name
+
+    def get_info(self, filename):
+        info = zipfile.ZipInfo(filename, date_time=self.date_time)
+        info.comment = "HTML FILE".encode()
+        info.create_system = 0
+        info.external_attr = 0o644 << 16
+        if filename.lower().endswith(self.stored_extensions):
+            info.compress_type = zipfile.ZIP_STORED
+        else:
+            info.compress_type = zipfile.ZIP_DEFLATED
+        return info
+
+    def spool_path(self):
+        return os.path.join(self.spool, str(len(self.entries)))
+
+    def _write_to_zipfile(self, filename, content):
+        if not self.contains(filename):
+            path = self.spool_path()
+            with open(path, 'wb') as fobj:
+                fobj.write(content if isinstance(content, bytes) else content.encode('utf-8'))
+            self.entries[filename] = path
+
+    def _copy_to_zipfile(self, filepath, arcname=None):
+        filename = arcname or filepath
+        if not self.contains(filename):
+            path = self.spool_path()
+            shutil.copyfile(filepath, path)
+            self.entries[filename] = path
+
+    def open(self):
+        self.spool = tempfile.mkdtemp()
+
+    def close(self):
+        if self.duplicates:
+            LOGGER.debug('Skipped {} duplicate files ({:.2f}MB) in {}'.format(self.duplicates, self.saved / 1024 ** 2, self.write_to_path))
+        try:
+            # Write to a temporary file so a zip at write_to_path is never partial
+            with zipfile.ZipFile(self.write_to_path + '.tmp', 'w') as zf:
+                for filename in sorted(self.entries):
+                    info = self.get_info(filename)
+                    info.file_size = os.path.getsize(self.entries[filename])  # So large files get zip64 headers
+                    with open(self.entries[filename], 'rb') as source, zf.open(info, 'w') as target:
+                        shutil.copyfileobj(source, target, 1024 ** 2)
+            os.replace(self.write_to_path + '.tmp', self.write_to_path)
+        finally:
+            shutil.rmtree(self.spool, ignore_errors=True)
+
+        if not self.contains('index.html'):
+            raise ReferenceError('Invalid Zip at {}: missing index.html file (use write_index_contents method)'.format(self.write_to_path))
+
+    def contains(self, filename):
+        return filename in self.entries
+
+    def get_stored_path(self, filepath):
+        """ Returns the path in zip that filepath was written to (or None if it hasn't been written) """
+        return filepath if self.contains(filepath) else self.names.get(filepath)
+
+    def write_contents(self, filename, contents, directory=None, dedupe=True):
+        """
+            Writes contents to the zip under its content hash, unless the same contents are already in the zip
+            Args:
+                filename (str): name of file in zip (only its extension is kept)
+                contents (str or bytes): contents of file
+                directory (str): directory in zipfile to write file to (optional)
+                dedupe (bool): set to False if the file must be written under filename
+                    (e.g. it has already been referenced)
+            Returns path to file in zip
+        """
+        filepath = "{}/{}".format(directory.rstrip("/"), filename) if directory else filename
+        if filepath == 'index.html' or not dedupe:
+            self._write_to_zipfile(filepath, contents)
+            return filepath
+
+        name = self.get_name(filepath, contents)
+        self.names[filepath] = name
+        if self.contains(name):
+            self.duplicates += 1
+            self.saved += len(contents)
+            return name
+
+        self._write_to_zipfile(name, contents)
+        return name
+
+    def write_url(self, url, filename, directory=None):
+        filepath = "{}/{}".format(directory.rstrip("/"), filename) if directory else filename
+        stored_path = self.get_stored_path(filepath)
+        if stored_path:
+            return stored_path
+        with STATS.stage('write_url'):
+            contents = self.asset_store.read(url) if self.asset_store else downloader.read(url)
+            return self.write_contents(filename, contents, directory=directory)
+
+
+def report_shared_assets(paths, write_to_path, **info):
+    """
+        Writes a report of the files that are stored in more than one zip
+        (e.g. an infographic that's linked from several topics)
+        Args:
+            paths ([str]): zips to check
+            write_to_path (str): json file to write report to
+            info: anything else to include in the report (e.g. language)
+        Returns (number of shared files, bytes spent storing them more than once)
+    """
+    assets = {}  # hash: {'size', 'files': [zip:path]} (one file per zip)
+    for path in paths:
+        seen = set()  # Copies within a zip aren't shared between zips (e.g. identical html in two directories)
+        with zipfile.ZipFile(path) as zf:
+            for entry in zf.infolist():
+                if entry.filename == 'index.html':
+                    continue
+                digest = hashlib.sha256(zf.read(entry)).hexdigest()
+                if digest in seen:
+                    continue
+                seen.add(digest)
+                asset = assets.setdefault(digest, {'size': entry.file_size, 'files': []})
+                asset['files'].append('{}:{}'.format(os.path.basename(path), entry.filename))
+
+    shared = {digest: asset for digest, asset in assets.items() if len(asset['files']) > 1}
+    wasted = sum(asset['size'] * (len(asset['files']) - 1) for asset in shared.values())
+    report = dict(info,
+        zips=len(paths),
+        files=sum(len(asset['files']) for asset in assets.values()),
+        shared=len(shared),
+        duplicate_bytes=wasted,
+        assets=sorted(shared.values(), key=lambda asset: asset['size'] * len(asset['files']), reverse=True),
+    )
+
+    if not os.path.exists(os.path.dirname(write_to_path)):
+        os.makedirs(os.path.dirname(write_to_path))
+    with open(write_to_path, 'w') as fobj:
+        json.dump(report, fobj, indent=2)
+    return len(shared), wasted
@@ -1,9 +1,15 @@
 #!/usr/bin/env python
+import argparse
 import json
+import logging
 import os
 import re
 import sys
+import time
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from requests.adapters import HTTPAdapter
 from ricecooker.utils import downloader, html_writer
 from ricecooker.chefs import SushiChef
 from ricecooker.classes import nodes, files, questions, licenses
@@ -13,12 +19,24 @@ from le_utils.constants import exercises, content_kinds, file_formats, format_pr
 
 from bs4 import BeautifulSoup
 from hashlib import md5
-from io import BytesIO
-from pdf2image import convert_from_bytes
-from PIL import Image
 
 from webmixer.utils import guess_scraper
 from scrapers import who
+from scrapers.adapters import wrap_session
+from scrapers.archive import RecordingAdapter, ReplayAdapter, ResponseArchive
+from scrapers.assets import AssetStore
+from scrapers.checkpoints import CheckpointLog
+from scrapers.documents import DOCUMENTS
+from scrapers.httpcache import RevalidatingCacheAdapter
+from scrapers.images import ImageOptimizer
+from scrapers.manifest import BuildManifest
+from scrapers.plan import log_changes, make_plan, save_plan
+from scrapers.session import RateLimiter, configure_session, connection_report
+from scrapers.sources import BASE_URL, BLACKLIST, SOURCE_MAP
+from scrapers.stats import STATS, InstrumentedAdapter
+from scrapers.thumbnails import ThumbnailRenderer
+from scrapers.videos import Transcoder
+from scrapers.zipper import report_shared_assets
 
 # Run constants
 ################################################################################
@@ -31,57 +49,21 @@ CHANNEL_THUMBNAIL = "https://news.umanitoba.ca/wp-content/uploads/2020/04/WHO.jp
 
 # Additional constants
 ################################################################################
-BASE_URL = 'https://www.who.int/{language}/emergencies/diseases/novel-coronavirus-2019/advice-for-public/{endpoint}'
-SOURCE_MAP = {
-    'en': {
-        'description': 'Stay aware of the latest information on the COVID-19 outbreak, ' +
-                        'available on the WHO website and through your national and local ' +
-                        'public health authority. Most countries around the world have '+
-                        'seen cases of COVID-19 and many are experiencing outbreaks. ' +
-                        'Authorities in China and some other countries have succeeded in ' +
-                        'slowing their outbreaks. However, the situation is unpredictable ' +
-                        'so check regularly for the latest news.',
-    },
-    'ar': {
-        'description': "احرص على متابعة آخر المستجدات عن فاشية مرض كوفيد-19، على ال" +
-                       "موقع الإلكتروني لمنظمة الصحة العالمية ومن خلال سلطات الصحة ال" +
-                       "عامة المحلية والوطنية. وفي حين لا تزال عدوى كوفيد-19 متفشية ف" +
-                       "ي الصين بشكل أساسي، فهناك بعض بؤر التفشي في بلدان أخرى.  و" +
-                       "معظم الأفرادلذين يصابون بالعدوى يشعرون بأعراض خفيفة ويتعافون، و" +
-                       "لكن الأعراض قد تظهر بشكل أكثر حدة لدى غيرهم. احرص على العناية ب"  +
-                       "صحتك وحماية الآخرين بواسطة التدابير التالية:",
-    },
-    'es': {
-        'description': "Manténgase al día de la información más reciente sobre el brote de COVID-19," +
-                       " a la que puede acceder en el sitio web de la OMS y a través de las autoridades" +
-                       " de salud pública pertinentes a nivel nacional y local. La COVID-19 sigue afectando " +
-                       "principalmente a la población de China, aunque se han producido brotes en otros " +
-                       "países. La mayoría de las personas que se infectan padecen una enfermedad leve y se " +
-                       "recuperan, pero en otros casos puede ser más grave.",
-    },
-    'fr': {
-        'description': "Tenez-vous au courant des dernières informations sur la flambée de COVID-19, " +
-                       "disponibles sur le site Web de l’OMS et auprès des autorités de santé publique " +
-                       "nationales et locales. La COVID-19 continue de toucher surtout la population de " +
-                       "la Chine, même si des flambées sévissent dans d’autres pays. La plupart des " +
-                       "personnes infectées présentent des symptômes bénins et guérissent, mais d’autres " +
-                       "peuvent avoir une forme plus grave.",
-    },
-    'zh': {
-        'description': "请随时了解世卫组织网站上以及您所在国家和地方公共卫生机构提供的关于2019冠状病毒病疫情的最新信息。" +
-                       "世界上大多数国家都出现了COVID-19病例，许多国家正发生疫情。中国和其他一些国家已经成功地减缓了疫情。" +
-                       "但是，这种情况不可预测，因此请定期查看最新消息。",
-    },
-    'ru': {
-        'description': "Следите за новейшей информацией о вспышке COVID-19, которую можно найти на веб-сайте ВОЗ, " +
-                       "а также получить от органов общественного здравоохранения вашей страны и населенного пункта." +
-                       " Наибольшее число случаев COVID-19 по-прежнему выявлено в Китае, тогда как в других странах " +
-                       "отмечаются вспышки локального характера. В большинстве случаев заболевание характеризуется " +
-                       "легким течением и заканчивается выздоровлением, хотя встречаются осложнения.",
-    },
-}
 LICENSE = licenses.CC_BY_NC_SALicense(copyright_holder="World Health Organization")
-BLACKLIST = ['healthy-parenting']
+TOPIC_WORKERS = 4                                           # Number of topic pages to scrape at the same time
+HOST_LIMIT = 4                                              # Maximum number of requests in flight per host
+RATE_LIMIT = 8                                              # Requests per second to each host (slows down on 429/5xx)
+ASSET_STORE_MB = 2048                                       # Maximum size of the shared asset store
+VIDEO_WORKERS = 2                                           # Number of videos to download at the same time
+THUMBNAIL_DPI = 50                                          # Resolution to render pdf thumbnails at
+IMAGE_MAX_WIDTH = 1200                                      # Width to shrink images to when optimize_images=true
+VIDEO_HEIGHT = 480                                          # Height to scale videos down to when transcode_videos=true
+PLAN_WORKERS = 8                                            # Number of HEAD requests to send at once in --plan mode
+WHO_URL = 'https://www.who.int/'
+PARSER = 'html5lib'                                         # Parser for finding topics and languages (e.g. lxml is faster)
+
+# Revalidate WHO pages with ETag/Last-Modified instead of downloading them in full on every run
+HTTP_CACHE = RevalidatingCacheAdapter(HTTPAdapter(max_retries=3), os.path.abspath(os.path.join('chefdata', 'httpcache')))
 
 # The chef subclass
 ################################################################################
@@ -100,6 +82,11 @@ class WhoCovidAdviceChef(SushiChef):
     """
     DATA_DIR = os.path.abspath('chefdata')
     DOWNLOADS_DIR = os.path.join(DATA_DIR, 'downloads')
+    VIDEOS_DIR = 'videos'
+    ASSETS_DIR = os.path.join(DATA_DIR, 'assets')  # Shared between languages
+    THUMBNAILS_DIR = os.path.join(DATA_DIR, 'thumbnails')  # Shared between languages
+    IMAGES_DIR = os.path.join(DATA_DIR, 'images')          # Shared between languages
+    TRANSCODES_DIR = os.path.join(DATA_DIR, 'transcodes')  # Shared between languages
 
     channel_info = {
         'CHANNEL_SOURCE_DOMAIN': CHANNEL_DOMAIN,
@@ -111,6 +98,8 @@ class WhoCovidAdviceChef(SushiChef):
     }
     language = 'en'  # Default to English if no language is provided
     options = None
+    video_workers = VIDEO_WORKERS
+    rate_limiter = None  # Shared by every chef in the process, as it's set up with the session
 
     def __init__(self, *args, **kwargs):
         super(WhoCovidAdviceChef, self).__init__(*args, **kwargs)
@@ -125,6 +114,63 @@ class WhoCovidAdviceChef(SushiChef):
         channel.source_domain = BASE_URL.format(language=self.language, endpoint='')
         return channel
 
+    def main(self):
+        STATS.reset()
+        try:
+            super(WhoCovidAdviceChef, self).main()
+        finally:
+            STATS.write(os.path.join(self.DATA_DIR, 'run_report.json'), language=self.options.get('language', self.language))
+
+    def pre_run(self, args, options):
+        use_http_cache()
+
+        # Limit requests per host so scraping topics in parallel doesn't get us throttled by who.int,
+        # and record the time and size of every request (outermost, so time spent waiting is included)
+        # Cached responses skip the limits, as they go under the caches
+        if not isinstance(downloader.DOWNLOAD_SESSION.get_adapter('https://'), InstrumentedAdapter):
+            limit = int(options.get('host_limit', HOST_LIMIT))
+            prefixes = ('http://', 'https://', WHO_URL)
+
+            # Keep connections to each host alive and slow down when a host pushes back (rate_limit=0 to turn off)
+            rate = float(options.get('rate_limit', RATE_LIMIT))
+            WhoCovidAdviceChef.rate_limiter = RateLimiter(rate) if rate else None
+            configure_session(downloader.DOWNLOAD_SESSION, self.rate_limiter, host_limit=limit, prefixes=prefixes)
+            wrap_session(downloader.DOWNLOAD_SESSION, lambda adapter: InstrumentedAdapter(adapter, STATS), prefixes=prefixes)
+
+        # Run a single page under cProfile (e.g. profile_url=https://www.who.int/...)
+        if options.get('profile_url'):
+            STATS.profile_url = options['profile_url']
+            STATS.profile_path = os.path.join(self.DATA_DIR, 'profile.prof')
+
+        # Read images and documents from the asset store so they're only downloaded once
+        max_bytes = int(options.get('asset_store_mb', ASSET_STORE_MB)) * 1024 ** 2
+        who.AssetStoreMixin.asset_store = AssetStore(self.ASSETS_DIR, max_bytes=max_bytes)
+
+        # Render the first page of linked pdfs to use as their preview images (thumbnails=false to turn off)
+        who.ThumbnailTag.thumbnail_renderer = None
+        if options.get('thumbnails') != 'false':
+            who.ThumbnailTag.thumbnail_renderer = ThumbnailRenderer(self.THUMBNAILS_DIR, dpi=int(options.get('thumbnail_dpi', THUMBNAIL_DPI)))
+
+        # Shrink images in zips for low-bandwidth devices
+        who.ContentNodeMixin.image_optimizer = None
+        if options.get('optimize_images') == 'true':
+            max_width = int(options.get('image_max_width', IMAGE_MAX_WIDTH))
+            who.ContentNodeMixin.image_optimizer = ImageOptimizer(self.IMAGES_DIR, max_width=max_width)
+
+        # Transcode videos to a lower resolution for low-end devices
+        if options.get('transcode_videos') == 'true':
+            if Transcoder.available():
+                who.ContentNodeMixin.transcoder = Transcoder(self.TRANSCODES_DIR, height=int(options.get('video_height', VIDEO_HEIGHT)))
+            else:
+                LOGGER.warning('ffmpeg was not found, so videos will not be transcoded')
+
+        # Reuse zips from the last run for pages that haven't changed
+        who.ContentNodeMixin.manifest = BuildManifest(os.path.join(self.DATA_DIR, 'manifest.json'))
+
+        # Record each node as it's finished, and with resume=true skip the ones finished by the last run
+        checkpoints_path = os.path.join(self.DATA_DIR, 'checkpoints.jsonl')
+        who.ContentNodeMixin.checkpoints = CheckpointLog(checkpoints_path, resume=options.get('resume') == 'true')
+
     def construct_channel(self, *args, **kwargs):
         """
         Creates ChannelNode and build topic tree
@@ -137,26 +183,54 @@ class WhoCovidAdviceChef(SushiChef):
         """
         channel = self.get_channel(*args, **kwargs)  # Create ChannelNode from data in self.channel_info
         LOGGER.info('Scraping {}'.format(self.language))
+        self.video_workers = int(kwargs.get('video_workers', VIDEO_WORKERS))
+
+        try:
+            # Scrape advice page to html zips
+            LOGGER.info('  Scraping advice page')
+            main_url = BASE_URL.format(language=self.language, endpoint='')
+            contents = DOCUMENTS.parse(main_url, kwargs.get('parser', PARSER))
+            title = contents.find('div', {'class': 'section-heading'}).text
+
+            # Scrape topics in parallel, then add them in page order so the tree stays the same
+            with ThreadPoolExecutor(max_workers=int(kwargs.get('topic_workers', TOPIC_WORKERS))) as executor:
+                futures = [executor.submit(self.scrape_page_to_html, main_url, title)]
+
+                # Get available topics
+                for topic_title, endpoint, topic_url in parse_topics(contents, self.language):
+                    LOGGER.info('    {}'.format(topic_title.encode('utf-8-sig')))
+                    if endpoint == 'videos':
+                        futures.append(executor.submit(self.scrape_video_page, topic_url, topic_title))
+                    elif endpoint not in BLACKLIST:
+                        futures.append(executor.submit(self.scrape_page_to_html, topic_url, topic_title))
+
+                for future in futures:
+                    channel.add_child(future.result())
 
-        # Scrape advice page to html zips
-        LOGGER.info('  Scraping advice page')
-        main_url = BASE_URL.format(language=self.language, endpoint='')
-        contents = BeautifulSoup(downloader.read(main_url), 'html5lib')
-        title = contents.find('div', {'class': 'section-heading'}).text
-        html = self.scrape_page_to_html(main_url, title)
-        channel.add_child(html)
-
-        # Get available topics
-        for topic in contents.find('ul', {'class': 'accordion-content'}).findAll('a'):
-            LOGGER.info('    {}'.format(topic.text.strip().encode('utf-8-sig')))
-            endpoint = topic['href'].split('/')[-1]
-            topic_url = BASE_URL.format(language=self.language, endpoint=endpoint)
-            if endpoint == 'videos':
-                video = self.scrape_video_page(topic_url, topic.text.strip())
-                channel.add_child(video)
-            elif endpoint not in BLACKLIST:
-                html = self.scrape_page_to_html(topic_url, topic.text.strip())
-                channel.add_child(html)
+            # Report files that are stored in more than one topic zip
+            zips = [file.path for node in channel.children for file in node.files if file.path.endswith('.zip')]
+            shared, wasted = report_shared_assets(zips, os.path.join(self.DATA_DIR, 'shared_assets.json'), language=self.language)
+            LOGGER.info('{} files are stored in more than one zip ({:.2f}MB duplicated)'.format(shared, wasted / 1024 ** 2))
+        finally:
+            # Stop the worker processes even if scraping failed
+            DOCUMENTS.clear()
+            if who.ThumbnailTag.thumbnail_renderer:
+                who.ThumbnailTag.thumbnail_renderer.shutdown()
+            if who.ContentNodeMixin.image_optimizer:
+                who.ContentNodeMixin.image_optimizer.shutdown()
+            if who.ContentNodeMixin.transcoder:
+                who.ContentNodeMixin.transcoder.shutdown()
+
+        if who.ContentNodeMixin.image_optimizer:
+            LOGGER.info(who.ContentNodeMixin.image_optimizer.report())
+        if who.ContentNodeMixin.transcoder:
+            LOGGER.info(who.ContentNodeMixin.transcoder.report())
+        LOGGER.info(HTTP_CACHE.report())
+        LOGGER.info(connection_report(downloader.DOWNLOAD_SESSION, prefixes=('http://', 'https://', WHO_URL)))
+        if self.rate_limiter:
+            LOGGER.info(self.rate_limiter.report())
+        if who.AssetStoreMixin.asset_store:
+            LOGGER.info(who.AssetStoreMixin.asset_store.report())
 
         return channel
 
@@ -167,55 +241,298 @@ class WhoCovidAdviceChef(SushiChef):
 
     def scrape_video_page(self, url, title):
         """ Creates a video topic with all the videos on the page """
-        IGNORED_VIDEOS = ['google', 'facebook']
         VIDEO_SCRAPERS = [who.WHOWebVideoScraper, who.WHOVideoScraper]
 
         video_topic = nodes.TopicNode(source_id=url, title=title)
-        contents = BeautifulSoup(downloader.read(url), 'html.parser')
-
-        # Scrape youtube embeds
-        # e.g. https://www.who.int/emergencies/diseases/novel-coronavirus-2019/advice-for-public/videos
-        for iframe in contents.findAll('iframe'):
-            if not any([test for test in IGNORED_VIDEOS if test in iframe['src']]):
-                header = iframe.find_parent('div', {'class': 'sf_colsIn'}).find('div', {'class': 'section-heading'}).text.strip()
-                LOGGER.info('      - Downloading {}'.format(header.encode('utf-8')))
-                scraper = guess_scraper(iframe['src'], scrapers=VIDEO_SCRAPERS) # Might be native or youtube video
-                video_node = scraper.to_contentnode(header, license=LICENSE, directory="videos")
-                video_topic.add_child(video_node)
-
-        # Scrape native videos
-        # e.g. https://www.who.int/zh/emergencies/diseases/novel-coronavirus-2019/advice-for-public/videos
-        for video in contents.findAll('div', {'class': 'sf-multimedia-item__video'}):
-            header = video.find('h3').text.strip()
-            LOGGER.info('      - Downloading {}'.format(header.encode('utf-8')))
-            video_matches = re.search(r"\(\s*\"(.+)\"\,\s*\"(.+)\"\)", video.find('a')['onclick'])
+        contents = DOCUMENTS.parse(url, 'html.parser')
 
-            # Embedded youtube videos here refer to playlists, so skip them
-            if 'YoutubeVideo' == video_matches.group(1):
-                continue
+        # Collect videos in page order so they can be downloaded in parallel
+        videos = []
+        for header, video_url, embedded in parse_videos(contents):
+            if embedded:
+                scraper = guess_scraper(video_url, scrapers=VIDEO_SCRAPERS) # Might be native or youtube video
+            else:
+                scraper = who.WHOVideoScraper(video_url)
+            videos.append((header, scraper))
 
-            scraper = who.WHOVideoScraper(video_matches.group(2))
-            video_node = scraper.to_contentnode(header, license=LICENSE, directory="videos")
-            video_topic.add_child(video_node)
+        def download_video(video):
+            header, scraper = video
+            LOGGER.info('      - Downloading {}'.format(header.encode('utf-8')))
+            return scraper.submit_contentnode(header, license=LICENSE, directory=self.VIDEOS_DIR)
+
+        # Download in parallel (videos from earlier runs are reused), transcoding in a separate
+        # pool sized to the number of cores, and add them in page order
+        with ThreadPoolExecutor(max_workers=self.video_workers) as executor:
+            for future in executor.map(download_video, videos):
+                video_topic.add_child(future.result())
 
         return video_topic
 
 
+def use_http_cache():
+    """ Sends requests to WHO pages through HTTP_CACHE (ricecooker caches everything else forever) """
+    if WHO_URL not in downloader.DOWNLOAD_SESSION.adapters:
+        downloader.DOWNLOAD_SESSION.mount(WHO_URL, HTTP_CACHE)
+
+
+def use_data_dir(data_dir):
+    """
+        Points the chef (and HTTP_CACHE) at another data directory, which must be empty
+        Args:
+            data_dir (str): directory to keep downloads, the manifest, checkpoints and caches in
+    """
+    if os.path.isdir(data_dir) and os.listdir(data_dir):
+        raise ValueError('{} is not empty, delete it or use another path'.format(data_dir))
+    WhoCovidAdviceChef.DATA_DIR = data_dir
+    for name in ('downloads', 'assets', 'thumbnails', 'images', 'transcodes'):
+        setattr(WhoCovidAdviceChef, '{}_DIR'.format(name.upper()), os.path.join(data_dir, name))
+    HTTP_CACHE.directory = os.path.join(data_dir, 'httpcache')
+
+
+def use_archive(record=None, replay=None):
+    """
+        Records every response during the run, or replays them instead of using the network
+        (youtube videos are downloaded by youtube_dl, so they can't be recorded or replayed)
+        Recording builds into an empty data directory named after the archive (chefdata/recording
+        for chefdata/recording.sqlite3), so every response the build needs ends up in the archive
+        Args:
+            record (str): path to archive to record responses to
+            replay (str): path to archive to replay responses from
+    """
+    prefixes = ('http://', 'https://', WHO_URL)
+    if replay:
+        adapter = ReplayAdapter(ResponseArchive(replay))
+        for prefix in prefixes:
+            downloader.DOWNLOAD_SESSION.mount(prefix, adapter)
+    elif record:
+        # Build into an empty data directory, so pages reused from the manifest, files kept in the
+        # asset store and revalidated with a 304, and nodes skipped on resume still get recorded
+        use_data_dir(os.path.splitext(os.path.abspath(record))[0])
+        use_http_cache()
+        archive = ResponseArchive(record)
+        wrap_session(downloader.DOWNLOAD_SESSION, lambda adapter: RecordingAdapter(adapter, archive), prefixes=prefixes)
+
+
 """ Utility function to check if any new languages have been added """
-def get_available_languages():
-    contents = BeautifulSoup(downloader.read(BASE_URL.format(language='en', endpoint='')), 'html5lib')
+def get_available_languages(parser=None):
+    use_http_cache()
+    contents = DOCUMENTS.parse(BASE_URL.format(language='en', endpoint=''), parser or PARSER)
+    return parse_languages(contents)
+
+
+def parse_languages(contents):
     languages = []
     for lang in contents.find('ul', {'class': 'sf-lang-selector'}).findAll('li'):
         languages.append(re.search(r"openLinkWithTranslation\('([^\']+)'\)", lang.find('a')['onclick']).group(1))
     return languages
 
 
+def parse_topics(contents, language):
+    """ Returns (title, endpoint, url) for each topic listed on the main page """
+    topics = []
+    for topic in contents.find('ul', {'class': 'accordion-content'}).findAll('a'):
+        endpoint = topic['href'].split('/')[-1]
+        topics.append((topic.text.strip(), endpoint, BASE_URL.format(language=language, endpoint=endpoint)))
+    return topics
+
+
+def parse_videos(contents):
+    """ Returns (header, url, whether it's an embed) for each video on the videos page, in page order """
+    IGNORED_VIDEOS = ['google', 'facebook']
+    videos = []
+
+    # Scrape youtube embeds
+    # e.g. https://www.who.int/emergencies/diseases/novel-coronavirus-2019/advice-for-public/videos
+    for iframe in contents.findAll('iframe'):
+        if not any([test for test in IGNORED_VIDEOS if test in iframe['src']]):
+            header = iframe.find_parent('div', {'class': 'sf_colsIn'}).find('div', {'class': 'section-heading'}).text.strip()
+            videos.append((header, iframe['src'], True))
+
+    # Scrape native videos
+    # e.g. https://www.who.int/zh/emergencies/diseases/novel-coronavirus-2019/advice-for-public/videos
+    for video in contents.findAll('div', {'class': 'sf-multimedia-item__video'}):
+        header = video.find('h3').text.strip()
+        video_matches = re.search(r"\(\s*\"(.+)\"\,\s*\"(.+)\"\)", video.find('a')['onclick'])
+
+        # Embedded youtube videos here refer to playlists, so skip them
+        if 'YoutubeVideo' == video_matches.group(1):
+            continue
+
+        videos.append((header, video_matches.group(2), False))
+    return videos
+
+
+def check_parser(paths, parser):
+    """
+        Checks that a parser finds the same title, topics and languages as html5lib
+        Args:
+            paths ([str]): saved WHO pages to check
+            parser (str): parser to compare with html5lib (e.g. 'lxml')
+        Returns list of paths where the results differ
+    """
+    def extract(contents):
+        heading = contents.find('div', {'class': 'section-heading'})
+        accordion = contents.find('ul', {'class': 'accordion-content'})
+        return {
+            'title': heading and heading.text,
+            'topics': accordion and [(topic.text.strip(), topic['href']) for topic in accordion.findAll('a')],
+            'languages': contents.find('ul', {'class': 'sf-lang-selector'}) and parse_languages(contents),
+        }
+
+    mismatches = []
+    for path in paths:
+        with open(path, 'rb') as fobj:
+            html = fobj.read()
+        if extract(BeautifulSoup(html, 'html5lib')) != extract(BeautifulSoup(html, parser)):
+            LOGGER.warning('{} gives different results with {} than html5lib'.format(path, parser))
+            mismatches.append(path)
+    return mismatches
+
+
 # CLI
 ################################################################################
+def run_language(language):
+    """
+        Runs the chef for a single language (used as a worker by the language pool)
+        Each language gets its own data and downloads directories so workers don't
+        collide, and every log message is tagged with the language code
+        Args:
+            language (str): language code from SOURCE_MAP
+        Returns (language, exit status, wall time in seconds)
+    """
+    start = time.time()
+
+    # Tag all log records made while this language is running
+    default_factory = logging.getLogRecordFactory()
+    def record_factory(*args, **kwargs):
+        record = default_factory(*args, **kwargs)
+        record.msg = '[{}] {}'.format(language, record.msg)
+        return record
+    logging.setLogRecordFactory(record_factory)
+
+    status = 0
+    try:
+        chef = WhoCovidAdviceChef(language=language)
+        chef.DATA_DIR = os.path.join(WhoCovidAdviceChef.DATA_DIR, language)
+        chef.DOWNLOADS_DIR = os.path.join(chef.DATA_DIR, 'downloads')
+        chef.VIDEOS_DIR = os.path.join(chef.DOWNLOADS_DIR, 'videos')
+        chef.main()
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except Exception:
+        LOGGER.exception('Failed to build channel')
+        status = 1
+    finally:
+        logging.setLogRecordFactory(default_factory)
+
+    return language, status, time.time() - start
+
+
+def run_languages(languages, workers=1):
+    """
+        Builds every language, running up to `workers` chefs in parallel processes
+        A failure in one language doesn't stop the others
+        Args:
+            languages ([str]): language codes to build
+            workers (int): number of worker processes
+        Returns list of (language, exit status, wall time in seconds)
+    """
+    if workers <= 1:
+        return [run_language(language) for language in languages]
+
+    # Drop the keep-alive connections left by finding the languages, so forked workers
+    # don't share (and interleave requests on) the same sockets
+    downloader.DOWNLOAD_SESSION.close()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(run_language, languages))
+
+
+def plan_language(language, parser=None):
+    """
+        Finds the topics, videos and linked files for a language without building it
+        Only the html pages are downloaded; files are checked with HEAD requests
+        Args:
+            language (str): language code from SOURCE_MAP
+            parser (str): parser for finding topics
+        Returns plan (see scrapers.plan.make_plan)
+    """
+    main_url = BASE_URL.format(language=language, endpoint='')
+    contents = DOCUMENTS.parse(main_url, parser or PARSER)
+
+    topics, videos, pages = {}, {}, [main_url]
+    for title, endpoint, url in parse_topics(contents, language):
+        if endpoint == 'videos':
+            topics[url] = title
+            videos.update((video_url, header) for header, video_url, _ in parse_videos(DOCUMENTS.parse(url, 'html.parser')))
+        elif endpoint not in BLACKLIST:
+            topics[url] = title
+            pages.append(url)
+
+    return make_plan(language, topics, videos, pages, workers=PLAN_WORKERS)
+
+
+def run_plan(languages, parser=None):
+    """
+        Writes a plan for each language to chefdata/plan-<language>.json and logs what
+        changed since the last plan (new languages, topics, videos and linked files)
+        Args:
+            languages ([str]): language codes to plan
+            parser (str): parser for finding topics
+    """
+    use_http_cache()
+    configure_session(downloader.DOWNLOAD_SESSION, host_limit=HOST_LIMIT, prefixes=('http://', 'https://', WHO_URL))
+
+    data_dir = WhoCovidAdviceChef.DATA_DIR
+    available = {'languages': get_available_languages(parser=parser)}
+    log_changes('Channel', save_plan(available, os.path.join(data_dir, 'plan.json'), sections=('languages',)))
+    for language in languages:
+        start = time.time()
+        plan = plan_language(language, parser=parser)
+        changes = save_plan(plan, os.path.join(data_dir, 'plan-{}.json'.format(language)))
+        LOGGER.info('{}: {} topics, {} videos, {} files ({:.2f}MB) ({:.1f}s)'.format(
+            language, len(plan['topics']), len(plan['videos']), len(plan['assets']), plan['size'] / 1024 ** 2, time.time() - start))
+        log_changes(language, changes)
+
+
 if __name__ == '__main__':
+    # Pull out driver options and leave the rest for ricecooker's parser
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--workers', type=int, default=1, help='Number of languages to build in parallel.')
+    parser.add_argument('--parser', default=PARSER, help='Parser for finding topics and languages (e.g. lxml).')
+    parser.add_argument('--check-parser', nargs='+', metavar='PAGE', help='Check --parser against html5lib on saved pages.')
+    parser.add_argument('--record', metavar='ARCHIVE', help='Record every response to an archive.')
+    parser.add_argument('--replay', metavar='ARCHIVE', help='Replay responses from an archive instead of using the network.')
+    parser.add_argument('--resume', action='store_true', help='Skip nodes that were finished by the last run.')
+    parser.add_argument('--plan', action='store_true', help='List what would be built and what changed, without building.')
+    driver_args, sys.argv[1:] = parser.parse_known_args()
+    if driver_args.record and driver_args.resume:
+        parser.error('--resume skips finished nodes, so their responses would be missing from --record')
+    if driver_args.resume:
+        sys.argv.append('resume=true')
+    PARSER = driver_args.parser
+    try:
+        use_archive(record=driver_args.record, replay=driver_args.replay)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if driver_args.check_parser:
+        sys.exit(int(bool(check_parser(driver_args.check_parser, PARSER))))
+
+    languages = []
     for language in get_available_languages():
         if not SOURCE_MAP.get(language):
             LOGGER.warning('{} is not listed in the SOURCE_MAP'.format(language))
             continue
-        chef = WhoCovidAdviceChef(language=language)
-        chef.main()
\ No newline at end of file
+        languages.append(language)
+
+    if driver_args.plan:
+        run_plan(languages, parser=PARSER)
+        sys.exit(0)
+
+    start = time.time()
+    results = run_languages(languages, workers=driver_args.workers)
+
+    LOGGER.info('Summary ({:.1f}s total)'.format(time.time() - start))
+    for language, status, elapsed in results:
+        LOGGER.info('  {}: {} ({:.1f}s)'.format(language, 'OK' if status == 0 else 'FAILED [exit {}]'.format(status), elapsed))
+    sys.exit(int(any(status for _, status, _ in results)))
@@ -0,0 +1,59 @@
+import threading
+
+import pytest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+        Serves `body` with an ETag and Last-Modified on every path, answering 304 when the ETag
+        still matches, and the queued (status, headers) for a path before that
+    """
+    protocol_version = 'HTTP/1.1'
+    url = None                                     # Base url of the server
+    etag = '"v1"'
+    last_modified = 'Wed, 21 Oct 2020 07:28:00 GMT'
+    body = b'<html>ok</html>'
+    queued = {}                                    # path: [(status, headers)]
+    requests = []                                  # (path, headers) of every request received
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.requests.append((self.path, dict(self.headers)))
+        queue = self.queued.get(self.path)
+        if queue:
+            status, headers = queue.pop(0)
+        elif self.headers.get('If-None-Match') == self.etag:
+            status, headers = 304, {}
+        else:
+            status, headers = 200, {}
+
+        body = self.body if status == 200 else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.etag)
+        self.send_header('Last-Modified', self.last_modified)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def stub_server():
+    """
+        Runs a StubHandler on a local port
+        Returns the handler class, so tests can change what it serves and check what it received
+    """
+    handler = type('StubHandler', (StubHandler,), {'queued': {}, 'requests': []})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    handler.url = 'http://127.0.0.1:{}'.format(httpd.server_port)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield handler
+    httpd.shutdown()
+    httpd.server_close()
@@ -0,0 +1,59 @@
+import base64
+
+import pytest
+import requests
+
+sushichef = pytest.importorskip('sushichef', exc_type=ImportError)  # Needs ricecooker, webmixer and pdf2image
+
+from benchmarks import run as benchmark
+from scrapers.archive import ResponseArchive
+from scrapers.sources import BASE_URL
+
+
+IMAGE_URL = 'https://www.who.int/images/default-source/health-topics/coronavirus/protect.png'
+PIXEL = base64.b64decode('iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+
+PAGE = """
+<html><body>
+    <div><div class="left-navigation--wrapper"></div></div>
+    <div class="row">
+        <div class="section-heading">Advice for the public</div>
+        <ul class="accordion-content">{topics}</ul>
+        <div class="sf-image"><a href="{image}"><img src="{image}"></a></div>
+    </div>
+</body></html>
+"""
+
+
+def add(archive, url, body, content_type='text/html; charset=utf-8'):
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.headers['Content-Type'] = content_type
+    response._content = body
+    archive.add('GET', url, response)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """ Archive with the main page, one topic that links an image, and a video topic """
+    archive = ResponseArchive(str(tmp_path / 'archive.sqlite3'))
+    topics = '<a href="/{0}">{0}</a>'.format('q-a') + '<a href="/{0}">{0}</a>'.format('videos')
+    add(archive, BASE_URL.format(language='en', endpoint=''), PAGE.format(topics=topics, image=IMAGE_URL).encode('utf-8'))
+    add(archive, BASE_URL.format(language='en', endpoint='q-a'), PAGE.format(topics='', image=IMAGE_URL).encode('utf-8'))
+    add(archive, IMAGE_URL, PIXEL, content_type='image/png')
+    return archive.path
+
+
+def test_benchmark_builds_channel_and_each_page(archive):
+    results = benchmark.run(archive, 'en')
+
+    assert results['build']['seconds'] > 0
+    assert results['skipped'] == ['videos']
+    assert sorted(results['pages']) == [BASE_URL.format(language='en', endpoint=''), BASE_URL.format(language='en', endpoint='q-a')]
+    for page in results['pages'].values():
+        assert page['seconds'] > 0 and page['peak_mb'] > 0
+    assert results['tags']['ThumbnailTag']['count'] == 2
+
+    # Every page build gets its own asset store, so nothing is left pointing at a deleted directory
+    assert benchmark.who.AssetStoreMixin.asset_store is None
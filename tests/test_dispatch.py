@@ -0,0 +1,113 @@
+from bs4 import BeautifulSoup
+
+from scrapers.dispatch import TagDispatcher
+
+
+PAGE = """
+<html><body>
+    <script>track()</script>
+    <div class="widget"><img src="old.png"></div>
+    <p>First</p>
+    <div class="widget plain"><span>No image</span></div>
+    <p class="skip-scrape">Marked</p>
+    <img src="photo.png">
+    <div class="note"><img src="marked.png"></div>
+</body></html>
+"""
+
+
+class FakeTag(object):
+    """ Stands in for webmixer's tag scrapers (which skip elements marked with skip-scrape) """
+    processed = []
+
+    def __init__(self, tag):
+        self.tag = tag
+
+    def scrape(self):
+        if 'skip-scrape' in (self.tag.get('class') or []):
+            return
+        self.processed.append((type(self).__name__, str(self.tag)))
+        self.process()
+
+    def new_tag(self, html):
+        return BeautifulSoup(html, 'html.parser').contents[0]
+
+
+class WidgetTag(FakeTag):
+    """ Replaces widgets with a figure, without marking the img it adds """
+    selector = ('div', {'class': 'widget'})
+
+    def process(self):
+        self.tag.replace_with(self.new_tag('<figure><img src="widget.png"></figure>'))
+
+
+class NoteTag(FakeTag):
+    """ Adds a marked img after notes """
+    selector = ('div', {'class': 'note'})
+
+    def process(self):
+        self.tag.insert_after(self.new_tag('<img class="skip-scrape" src="note.png">'))
+
+
+class ParagraphTag(FakeTag):
+    """ Adds a caption with an unmarked img to paragraphs """
+    selector = ('p',)
+
+    def process(self):
+        self.tag.append(self.new_tag('<img src="caption.png">'))
+
+
+class ImageTag(FakeTag):
+    selector = ('img',)
+
+    def process(self):
+        self.tag['src'] = 'img/' + self.tag['src']
+
+
+TAG_CLASSES = [WidgetTag, NoteTag, ParagraphTag, ImageTag]
+
+
+def legacy_process(contents, omit_list):
+    """ The find_all loop the dispatcher replaces (see webmixer's HTMLPageScraper.process) """
+    for item in omit_list:
+        for element in contents.find_all(*item):
+            element.decompose()
+    for tag_class in TAG_CLASSES:
+        for tag in contents.find_all(*tag_class.selector):
+            tag_class(tag).scrape()
+
+
+def dispatch(contents, omit_list):
+    TagDispatcher(TAG_CLASSES, omit_list=omit_list).run(contents, lambda tag_class, element: tag_class(element))
+
+
+def process(function):
+    FakeTag.processed = []
+    contents = BeautifulSoup(PAGE, 'html.parser')
+    function(contents, [('script',)])
+    return str(contents), FakeTag.processed
+
+
+def test_output_matches_find_all_loop():
+    assert process(dispatch) == process(legacy_process)
+
+
+def test_unmarked_inserted_elements_are_processed():
+    html, processed = process(dispatch)
+    assert 'img/widget.png' in html
+    assert 'img/caption.png' in html
+    assert 'src="note.png"' in html
+    assert ('ImageTag', '<img src="old.png"/>') not in processed
+
+
+def test_tree_is_only_walked_again_when_tags_add_elements():
+    walks = []
+
+    class CountingDispatcher(TagDispatcher):
+        def collect(self, contents, omit=True):
+            walks.append(omit)
+            return super(CountingDispatcher, self).collect(contents, omit=omit)
+
+    contents = BeautifulSoup(PAGE, 'html.parser')
+    CountingDispatcher(TAG_CLASSES, omit_list=[('script',)]).run(contents, lambda tag_class, element: tag_class(element))
+    assert walks == [True, False, False]  # After WidgetTag and ParagraphTag, but not NoteTag
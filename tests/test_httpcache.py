@@ -0,0 +1,70 @@
+import pytest
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from scrapers.httpcache import RevalidatingCacheAdapter
+
+
+@pytest.fixture
+def server(stub_server):
+    stub_server.body = b'<html>version 1</html>'
+    return stub_server
+
+
+def new_run(directory):
+    """ Returns a session and cache as a new run would set them up """
+    cache = RevalidatingCacheAdapter(HTTPAdapter(), directory)
+    session = requests.Session()
+    session.mount('http://', cache)
+    return session, cache
+
+
+def test_first_run_downloads_and_stores_page(server, tmp_path):
+    session, cache = new_run(str(tmp_path))
+    response = session.get(server.url + '/page')
+
+    assert response.status_code == 200
+    assert response.content == b'<html>version 1</html>'
+    assert cache.counters == {'200': 1, '304': 0, 'hits': 0}
+    assert cache.load(server.url + '/page')[1] == b'<html>version 1</html>'
+    assert 'If-None-Match' not in server.requests[0][1]
+
+
+def test_pages_are_only_checked_once_per_run(server, tmp_path):
+    session, cache = new_run(str(tmp_path))
+    session.get(server.url + '/page')
+    response = session.get(server.url + '/page')
+
+    assert response.content == b'<html>version 1</html>'
+    assert cache.counters['hits'] == 1
+    assert len(server.requests) == 1
+
+
+def test_next_run_revalidates_and_serves_304_from_disk(server, tmp_path):
+    new_run(str(tmp_path))[0].get(server.url + '/page')
+
+    session, cache = new_run(str(tmp_path))
+    response = session.get(server.url + '/page')
+
+    assert server.requests[-1][1]['If-None-Match'] == '"v1"'
+    assert server.requests[-1][1]['If-Modified-Since'] == 'Wed, 21 Oct 2020 07:28:00 GMT'
+    assert response.status_code == 200
+    assert response.content == b'<html>version 1</html>'
+    assert response.headers['ETag'] == '"v1"'
+    assert cache.counters == {'200': 0, '304': 1, 'hits': 0}
+
+
+def test_changed_etag_replaces_stored_page(server, tmp_path):
+    new_run(str(tmp_path))[0].get(server.url + '/page')
+
+    server.etag = '"v2"'
+    server.body = b'<html>version 2</html>'
+    session, cache = new_run(str(tmp_path))
+    response = session.get(server.url + '/page')
+
+    assert response.content == b'<html>version 2</html>'
+    assert cache.counters['200'] == 1
+    metadata, body = cache.load(server.url + '/page')
+    assert body == b'<html>version 2</html>'
+    assert metadata['headers']['ETag'] == '"v2"'
@@ -0,0 +1,121 @@
+import threading
+import time
+
+import pytest
+import requests
+
+from email.utils import formatdate
+from requests.adapters import HTTPAdapter
+
+from scrapers.httpcache import RevalidatingCacheAdapter
+from scrapers.session import RateLimitAdapter, RateLimiter, TokenBucket, configure_session, connection_report
+
+
+def new_session(limiter=None, host_limit=4):
+    session = requests.Session()
+    session.mount('http://', HTTPAdapter())
+    configure_session(session, limiter, host_limit=host_limit, prefixes=('http://',))
+    return session
+
+
+def throttled(status, retry_after):
+    response = requests.Response()
+    response.status_code = status
+    response.headers['Retry-After'] = retry_after
+    return response
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retry_after_in_seconds(status):
+    adapter = RateLimitAdapter(HTTPAdapter(), RateLimiter(8))
+    assert adapter.get_delay(throttled(status, '7'), 0) == 7
+    assert adapter.get_delay(throttled(status, '600'), 0) == adapter.max_wait
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_retry_after_as_http_date(status):
+    adapter = RateLimitAdapter(HTTPAdapter(), RateLimiter(8))
+    delay = adapter.get_delay(throttled(status, formatdate(time.time() + 30, usegmt=True)), 0)
+    assert 28 <= delay <= 30
+    assert adapter.get_delay(throttled(status, formatdate(time.time() - 30, usegmt=True)), 0) == 0
+
+
+@pytest.mark.parametrize('status', [429, 503])
+def test_throttled_requests_are_retried_after_retry_after(stub_server, status):
+    stub_server.queued['/page'] = [(status, {'Retry-After': '1'})]
+    limiter = RateLimiter(8)
+    start = time.monotonic()
+    response = new_session(limiter).get(stub_server.url + '/page')
+
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 1
+    assert [path for path, headers in stub_server.requests] == ['/page', '/page']
+    assert limiter.counts['retry'] == 1
+    assert limiter.counts['429' if status == 429 else '5xx'] == 1
+    assert limiter.get_bucket(stub_server.url.split('//')[1]).rate == pytest.approx(4.4)  # Halved, then sped up by the retry
+
+
+def test_host_limit_is_not_held_while_waiting_to_retry(stub_server):
+    stub_server.queued['/slow'] = [(503, {'Retry-After': '2'})]
+    session = new_session(RateLimiter(8), host_limit=1)
+    thread = threading.Thread(target=session.get, args=(stub_server.url + '/slow',))
+    thread.start()
+    time.sleep(0.5)
+
+    start = time.monotonic()
+    assert session.get(stub_server.url + '/other').status_code == 200
+    assert time.monotonic() - start < 1
+    thread.join()
+
+
+def test_bucket_slows_down_and_recovers():
+    bucket = TokenBucket(10, burst=1)
+    bucket.acquire()
+    bucket.slow_down()
+    assert bucket.rate == 5
+
+    # Tokens saved up before slowing down can't be spent straight away
+    start = time.monotonic()
+    bucket.acquire()
+    assert time.monotonic() - start >= 0.15
+
+    for _ in range(9):
+        bucket.speed_up()
+    assert bucket.rate == pytest.approx(9.5)
+    bucket.speed_up()
+    bucket.speed_up()
+    assert bucket.rate == 10
+
+    for _ in range(10):
+        bucket.slow_down()
+    assert bucket.rate == bucket.min_rate
+
+
+def test_cached_responses_skip_the_rate_limit(stub_server, tmp_path):
+    session = requests.Session()
+    cache = RevalidatingCacheAdapter(HTTPAdapter(), str(tmp_path))
+    session.mount('http://', cache)
+    configure_session(session, RateLimiter(1, burst=1), prefixes=('http://',))
+    assert isinstance(cache.adapter, RateLimitAdapter)
+
+    session.get(stub_server.url + '/page')
+    start = time.monotonic()
+    for _ in range(3):
+        assert session.get(stub_server.url + '/page').content == b'<html>ok</html>'
+    assert time.monotonic() - start < 0.5
+    assert cache.counters['hits'] == 3
+
+
+def test_connections_are_reused(stub_server):
+    session = new_session(RateLimiter(100))
+    for _ in range(10):
+        session.get(stub_server.url + '/page')
+
+    assert '127.0.0.1: 10 requests over 1 connections (90% reused)' in connection_report(session, prefixes=('http://',))
+
+
+def test_configure_session_is_idempotent():
+    session = new_session(RateLimiter(8))
+    adapter = session.get_adapter('http://')
+    configure_session(session, RateLimiter(8), prefixes=('http://',))
+    assert session.get_adapter('http://') is adapter